@@ -0,0 +1,101 @@
+"""Leader failover time with the state-store lease.
+
+    python benchmarks/bench_failover.py [--ttl 3] [--replicas 2] [--trials 5]
+
+Replicas share a lease in a temporary directory through the local backend
+(files plus flock); set BOT_STATE_BACKEND=oci with BOT_STATE_OCI_FAKE to
+exercise the Object Storage path instead. Each trial crashes the leader
+without releasing and measures how long until a standby leads, and checks
+that at most one replica ever believes it leads. A clean handover
+(``release``) is measured once at the end. Prints one JSON object per trial.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+os.environ.setdefault("BOT_STATE_NAMESPACE", "benchmark")
+os.environ.setdefault("BOT_STATE_BUCKET", "benchmark")
+
+from solid_funicular.lease import Lease  # noqa: E402
+from solid_funicular.state import JsonState  # noqa: E402
+
+
+async def run(args: argparse.Namespace, directory: str) -> None:
+    path = os.path.join(directory, "leader.json")
+
+    async def noop() -> None:
+        pass
+
+    def replica(name: str) -> Lease:
+        return Lease(JsonState(path, "leader.json"), args.ttl, noop, noop, name)
+
+    replicas = [replica(f"replica-{i}") for i in range(args.replicas)]
+    for lease in replicas:
+        lease.start()
+    spawned = len(replicas)
+    max_leaders = 0
+
+    async def wait_for_leader(exclude: Lease) -> Lease:
+        nonlocal max_leaders
+        while True:
+            leaders = [r for r in replicas if r.is_leader and r is not exclude]
+            max_leaders = max(max_leaders, len(leaders))
+            if leaders:
+                return leaders[0]
+            await asyncio.sleep(0.01)
+
+    current = await wait_for_leader(exclude=None)
+    for trial in range(args.trials + 1):
+        clean = trial == args.trials
+        started = time.monotonic()
+        if clean:
+            current.release()
+        else:
+            # Crash: stop renewing without giving the lease up.
+            current._task.cancel()
+            current.is_leader = False
+        replicas.remove(current)
+        successor = await wait_for_leader(exclude=current)
+        print(
+            json.dumps(
+                {
+                    "trial": trial,
+                    "handover": "release" if clean else "crash",
+                    "ttl": args.ttl,
+                    "takeover_seconds": round(time.monotonic() - started, 3),
+                    "term": successor.term,
+                    "max_simultaneous_leaders": max_leaders,
+                }
+            ),
+            flush=True,
+        )
+        # Keep the replica count up, as a restarted container would.
+        replacement = replica(f"replica-{spawned}")
+        spawned += 1
+        replacement.start()
+        replicas.append(replacement)
+        current = successor
+    for lease in replicas:
+        lease.release()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ttl", type=float, default=3.0)
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--trials", type=int, default=5)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(args, directory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""Moderation hot paths against an in-process synthetic guild.
+
+    python benchmarks/bench_guild.py [--members 1000,10000,100000] [--latency 0.05]
+
+Each member count runs in a fresh interpreter with its own state directory.
+Members, roles, alts and punishments are generated from a fixed seed; the
+guild, members and channels are stand-ins whose REST calls go through a stub
+HTTP layer that counts them per route and sleeps ``--latency`` seconds each.
+Scenarios: on_message screening, remove_manage_roles, the check() sweep,
+/setup and FileDict persistence. Prints one JSON object per scenario with
+wall time, REST calls issued and state bytes persisted.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+GUILD_ID = 1
+MEMBER_ROLE_ID = 2
+FIRST_MEMBER_ID = 10**17
+
+
+class StubHTTP:
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls: collections.Counter[str] = collections.Counter()
+
+    async def request(self, method: str, path: str) -> None:
+        self.calls[f"{method} {path}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeRole:
+    def __init__(self, role_id: int, permissions: Any) -> None:
+        self.id = role_id
+        self.permissions = permissions
+        self.guild: Optional["FakeGuild"] = None
+
+    def is_default(self) -> bool:
+        return self.id == GUILD_ID
+
+
+class FakeMessage:
+    def __init__(self, http: StubHTTP, channel: "FakeChannel", content: str) -> None:
+        self.http = http
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content: str) -> None:
+        await self.http.request(
+            "PATCH", "/channels/{channel_id}/messages/{message_id}"
+        )
+        self.content = content
+
+
+class FakeChannel:
+    def __init__(self, http: StubHTTP, channel_id: int) -> None:
+        self.http = http
+        self.id = channel_id
+
+    async def send(self, content: str, **kwargs: Any) -> FakeMessage:
+        await self.http.request("POST", "/channels/{channel_id}/messages")
+        return FakeMessage(self.http, self, content)
+
+
+class FakeMember:
+    bot = False
+
+    def __init__(self, http: StubHTTP, guild: "FakeGuild", member_id: int) -> None:
+        self.http = http
+        self.guild = guild
+        self.id = member_id
+        self.roles: list[FakeRole] = []
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    async def send(self, content: str, **kwargs: Any) -> None:
+        await self.http.request("POST", "/channels/{channel_id}/messages")
+
+    async def edit(self, *, roles: list[FakeRole]) -> None:
+        await self.http.request("PATCH", "/guilds/{guild_id}/members/{user_id}")
+        self.roles = [self.guild.default_role, *roles]
+
+    async def add_roles(self, *roles: FakeRole) -> None:
+        for role in roles:
+            await self.http.request(
+                "PUT", "/guilds/{guild_id}/members/{user_id}/roles/{role_id}"
+            )
+            self.roles.append(role)
+
+
+class FakeGuild:
+    filesize_limit = 25 * 1024 * 1024
+
+    def __init__(self, roles: list[FakeRole]) -> None:
+        self.id = GUILD_ID
+        self.roles = roles
+        self.default_role = roles[0]
+        self._roles = {role.id: role for role in roles}
+        self._members: dict[int, FakeMember] = {}
+        for role in roles:
+            role.guild = self
+
+    @property
+    def members(self) -> list[FakeMember]:
+        return list(self._members.values())
+
+    def add_member(self, member: FakeMember) -> None:
+        self._members[member.id] = member
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self._members.get(member_id)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self._roles.get(role_id)
+
+
+class FakeContext:
+    def __init__(
+        self, http: StubHTTP, guild: FakeGuild, channel: FakeChannel
+    ) -> None:
+        self.http = http
+        self.guild = guild
+        self.channel = channel
+
+    async def defer(self, **kwargs: Any) -> None:
+        await self.http.request(
+            "POST", "/interactions/{interaction_id}/{token}/callback"
+        )
+
+    async def respond(self, content: str, **kwargs: Any) -> None:
+        await self.http.request("POST", "/webhooks/{application_id}/{token}")
+
+
+def build_guild(args: argparse.Namespace, http: StubHTTP) -> FakeGuild:
+    """Same guild for the same arguments, so every scenario starts equal."""
+    import discord
+
+    rng = random.Random(args.seed)
+    privileged = discord.Permissions(manage_messages=True, manage_roles=True)
+    plain = discord.Permissions(send_messages=True, read_messages=True)
+    roles = [FakeRole(GUILD_ID, plain), FakeRole(MEMBER_ROLE_ID, plain)]
+    for i in range(args.roles):
+        is_privileged = i < args.privileged_roles
+        roles.append(FakeRole(100 + i, privileged if is_privileged else plain))
+    guild = FakeGuild(roles)
+    privileged_roles = roles[2 : 2 + args.privileged_roles]
+    plain_roles = roles[2 + args.privileged_roles :]
+    verified = args.members - int(args.members * args.unverified_ratio)
+    for i in range(args.members):
+        member = FakeMember(http, guild, FIRST_MEMBER_ID + i)
+        member.roles = [guild.default_role]
+        if i < verified:
+            member.roles.append(roles[1])
+        member.roles += rng.sample(plain_roles, min(len(plain_roles), 2))
+        if privileged_roles and rng.random() < args.privileged_ratio:
+            member.roles.append(rng.choice(privileged_roles))
+        guild.add_member(member)
+    return guild
+
+
+def write_state(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    ids = [FIRST_MEMBER_ID + i for i in range(args.members)]
+    # The same members build_guild gives the member role to.
+    verified = ids[: args.members - int(args.members * args.unverified_ratio)]
+    mains = verified[: max(1, len(verified) - int(len(verified) * args.alt_ratio))]
+    users: dict[str, Optional[int]] = {str(i): None for i in mains}
+    for alt in verified[len(mains) :]:
+        users[str(alt)] = rng.choice(mains)
+    until = time.time() + 86400
+    punished = rng.sample(mains, min(len(mains), args.punishments))
+    punishment = {str(i): until for i in punished}
+    os.makedirs("data", exist_ok=True)
+    for name, data in (("users.json", users), ("punishment.json", punishment)):
+        with open(os.path.join("data", name), "w") as f:
+            json.dump(data, f)
+
+
+def messages(count: int, channels: list[FakeChannel], authors: list[FakeMember]):
+    rng = random.Random(count)
+    words = ["山手線", "次は", "hello", "world", "お出口は左側です。", "lol", "😀"]
+    for _ in range(count):
+        author = rng.choice(authors)
+        content = " ".join(rng.choice(words) for _ in range(rng.randint(1, 60)))
+        if rng.random() < 0.1:
+            content += " " + " ".join(m.mention for m in rng.sample(authors, 3))
+        yield FakeMessage(author.http, rng.choice(channels), content), author
+
+
+async def run_child(args: argparse.Namespace) -> None:
+    from solid_funicular import main
+    from solid_funicular.state import STATE_IO_BYTES
+
+    http = StubHTTP(args.latency)
+    guild: FakeGuild
+    main.bot.get_guild = lambda guild_id: guild if guild_id == GUILD_ID else None
+    await main.load_state()
+    state = main.guild_states[GUILD_ID]
+    backend = state.users.store.backend
+    channels = [FakeChannel(http, 1000 + i) for i in range(10)]
+
+    async def persist() -> None:
+        await asyncio.gather(*(store.aflush() for store in main.state_stores))
+
+    async def on_message() -> int:
+        authors = guild.members[:1000]
+        count = 0
+        for message, author in messages(args.messages, channels, authors):
+            message.author = author
+            await main.on_message(message)
+            count += 1
+        return count
+
+    async def remove_manage_roles() -> int:
+        members = guild.members
+        await main.run_pool(
+            members,
+            main.remove_manage_roles,
+            main.ROLE_EDIT_CONCURRENCY,
+            state.role_edit_limiter,
+        )
+        return len(members)
+
+    async def check() -> int:
+        await main.check()
+        await persist()
+        return len(state.users)
+
+    async def setup() -> int:
+        await main.setup.callback(FakeContext(http, guild, channels[0]))
+        await persist()
+        return len(guild.members)
+
+    async def file_dict() -> int:
+        rng = random.Random(args.seed)
+        keys = list(state.users)
+        for _ in range(args.rounds):
+            for key in rng.sample(keys, min(len(keys), args.churn)):
+                state.users[key] = None if state.users[key] else int(keys[0])
+            await state.users.aflush()
+        return args.rounds * args.churn
+
+    scenarios = {
+        "on_message": on_message,
+        "remove_manage_roles": remove_manage_roles,
+        "check": check,
+        "setup": setup,
+        "file_dict": file_dict,
+    }
+    for name, scenario in scenarios.items():
+        if args.scenarios and name not in args.scenarios:
+            continue
+        guild = build_guild(args, http)
+        main.privileged_roles.build(guild)
+        http.calls.clear()
+        saved = STATE_IO_BYTES.value(backend, "save")
+        started = time.perf_counter()
+        items = await scenario()
+        seconds = time.perf_counter() - started
+        print(
+            json.dumps(
+                {
+                    "scenario": name,
+                    "backend": backend,
+                    "members": args.members,
+                    "latency": args.latency,
+                    "items": items,
+                    "seconds": round(seconds, 4),
+                    "rest_calls": sum(http.calls.values()),
+                    "rest_calls_by_route": dict(http.calls),
+                    "bytes_persisted": int(
+                        STATE_IO_BYTES.value(backend, "save") - saved
+                    ),
+                }
+            ),
+            flush=True,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", default="1000,10000,100000")
+    parser.add_argument("--roles", type=int, default=50)
+    parser.add_argument("--privileged-roles", type=int, default=5)
+    parser.add_argument("--privileged-ratio", type=float, default=0.05)
+    parser.add_argument("--alt-ratio", type=float, default=0.1)
+    parser.add_argument("--unverified-ratio", type=float, default=0.05)
+    parser.add_argument("--punishments", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--churn", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--backend", default="local", choices=["local", "sqlite"])
+    parser.add_argument("--role-edit-rate", default="1000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", nargs="*")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.members = int(args.members)
+        write_state(args)
+        asyncio.run(run_child(args))
+        return
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(SRC),
+        "BOT_STATE_BACKEND": args.backend,
+        "BOT_STATE_SQLITE_PATH": "data/state.sqlite3",
+        "ROLE_EDIT_RATE": args.role_edit_rate,
+        "ROLE_EDIT_BURST": args.role_edit_rate,
+        # Dummy configuration so solid_funicular.main can be imported.
+        "DISCORD_TOKEN": "benchmark",
+        "GUILD_ID": str(GUILD_ID),
+        "ANNOUNCE_GUILD_ID": "",
+        "MEMBER_ROLE_ID": str(MEMBER_ROLE_ID),
+        "ESHIRITORI_CHANNEL_ID": "1",
+        "ARCHIVE_CATEGORY_ID": "1",
+    }
+    passthrough = []
+    argv = iter(sys.argv[1:])
+    for arg in argv:
+        if arg == "--members":
+            next(argv, None)
+        elif not arg.startswith("--members="):
+            passthrough.append(arg)
+    for members in args.members.split(","):
+        with tempfile.TemporaryDirectory() as directory:
+            subprocess.run(
+                [sys.executable, __file__, "--child", "--members", members]
+                + passthrough,
+                cwd=directory,
+                env=env,
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
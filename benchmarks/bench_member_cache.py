@@ -0,0 +1,168 @@
+"""Memory held by the member cache, full vs lean (MEMBER_CACHE=lean).
+
+    python benchmarks/bench_member_cache.py [--members 10000,100000] [--tracked 1000]
+
+Builds py-cord Guild objects from synthetic GUILD_CREATE payloads, as the
+gateway would after chunking. In full mode every member is cached; in lean
+mode py-cord caches none and ``--tracked`` members (punished users and their
+alts) are resolved through MemberCache, whose batched member requests are
+answered from the same payloads and counted. Memory is measured with
+tracemalloc after a collection, so it is what the cache keeps alive. Prints
+one JSON object per member count and mode.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import discord  # noqa: E402
+
+from solid_funicular.members import MemberCache  # noqa: E402
+
+GUILD_ID = 1
+MEMBER_ROLE_ID = 2
+FIRST_MEMBER_ID = 10**17
+
+
+def member_payload(member_id: int, rng: random.Random) -> dict[str, Any]:
+    return {
+        "user": {
+            "id": str(member_id),
+            "username": f"user{member_id}",
+            "global_name": f"User {member_id}",
+            "discriminator": "0",
+            "avatar": f"{rng.getrandbits(128):032x}",
+        },
+        "roles": [str(MEMBER_ROLE_ID)]
+        + [str(100 + rng.randrange(50)) for _ in range(rng.randrange(4))],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+    }
+
+
+def role_payload(role_id: int) -> dict[str, Any]:
+    return {
+        "id": str(role_id),
+        "name": f"role{role_id}",
+        "permissions": "0",
+        "position": role_id,
+        "color": 0,
+        # Sent by Discord alongside "color"; py-cord >= 2.7 requires it.
+        "colors": {
+            "primary_color": 0,
+            "secondary_color": None,
+            "tertiary_color": None,
+        },
+        "hoist": False,
+        "managed": False,
+        "mentionable": False,
+    }
+
+
+def guild_payload(members: list[dict[str, Any]]) -> dict[str, Any]:
+    return {
+        "id": str(GUILD_ID),
+        "name": "benchmark",
+        "roles": [role_payload(GUILD_ID), role_payload(MEMBER_ROLE_ID)]
+        + [role_payload(100 + i) for i in range(50)],
+        "members": members,
+        "member_count": len(members),
+        "large": True,
+        "channels": [],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+    }
+
+
+class BenchGuild(discord.Guild):
+    """Answers member requests from the synthetic payloads."""
+
+    payloads: dict[int, dict[str, Any]]
+    requests: int
+
+    async def query_members(self, *, user_ids, limit, cache, **kwargs):
+        self.requests += 1
+        return [
+            discord.Member(data=self.payloads[i], guild=self, state=self._state)
+            for i in user_ids[:limit]
+            if i in self.payloads
+        ]
+
+
+async def measure(args: argparse.Namespace, members: int, lean: bool) -> None:
+    rng = random.Random(args.seed)
+    ids = [FIRST_MEMBER_ID + i for i in range(members)]
+    payloads = {i: member_payload(i, rng) for i in ids}
+    tracked = rng.sample(ids, min(args.tracked, members))
+    client = discord.Client(
+        intents=discord.Intents(guilds=True, members=True),
+        member_cache_flags=(
+            discord.MemberCacheFlags.none()
+            if lean
+            else discord.MemberCacheFlags.from_intents(
+                discord.Intents(guilds=True, members=True)
+            )
+        ),
+    )
+    state = client._connection
+    cache = MemberCache(lean, args.capacity)
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    guild = BenchGuild(data=guild_payload(list(payloads.values())), state=state)
+    guild.payloads = payloads
+    guild.requests = 0
+    started = time.perf_counter()
+    resolved = await cache.resolve(guild, tracked)
+    seconds = time.perf_counter() - started
+    del resolved
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    print(
+        json.dumps(
+            {
+                "mode": "lean" if lean else "full",
+                "members": members,
+                "tracked": len(tracked),
+                "cached_members": len(guild.members),
+                "member_requests": guild.requests,
+                "resolve_seconds": round(seconds, 4),
+                "bytes_held": held,
+                "bytes_per_member": round(held / members, 1),
+            }
+        ),
+        flush=True,
+    )
+    await client.close()
+
+
+async def run(args: argparse.Namespace) -> None:
+    for members in [int(m) for m in args.members.split(",")]:
+        for lean in (False, True):
+            await measure(args, members, lean)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", default="10000,100000")
+    parser.add_argument("--tracked", type=int, default=1000)
+    parser.add_argument("--capacity", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""JsonState's OCI backend against the local Object Storage fake.
+
+    python benchmarks/bench_object_storage.py [--writers 4] [--ops 200]
+        [--profiles clean,latency,throttled,faulty,partial]
+
+Several JsonState instances (standing in for several bot processes) write
+the same object concurrently, each adding its own keys and saving through
+the conditional-PUT / merge path, while readers load it. Each fault profile
+reports load/save throughput and latency percentiles, failed saves, the
+fake's request and fault counts, and ``lost_writes``: keys whose save was
+acknowledged but that are missing from the object afterwards (must be 0).
+Prints one JSON object per profile.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+os.environ.setdefault("BOT_STATE_RETRY_BASE_DELAY", "0.01")
+os.environ.setdefault("BOT_STATE_RETRY_MAX_DELAY", "0.2")
+os.environ.setdefault("BOT_STATE_CONFLICT_ATTEMPTS", "10")
+
+PROFILES = {
+    "clean": {},
+    "latency": {"latency": 0.02, "jitter": 0.08},
+    "throttled": {"latency": 0.01, "throttle_rate": 0.2},
+    "faulty": {"latency": 0.01, "error_rate": 0.1},
+    "partial": {"latency": 0.01, "partial_rate": 0.2},
+}
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": at(0.5),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+async def run_profile(name: str, knobs: dict, args: argparse.Namespace) -> dict:
+    from solid_funicular.fake_object_storage import FakeObjectStorage
+    from solid_funicular.state import JsonState
+
+    fake = FakeObjectStorage(seed=args.seed, **knobs)
+
+    def store() -> JsonState:
+        state = JsonState("unused.json", f"{name}.json")
+        state._client = fake
+        return state
+
+    save_times: list[float] = []
+    load_times: list[float] = []
+    acked: set[str] = set()
+    failed = 0
+
+    async def writer(index: int) -> None:
+        nonlocal failed
+        state = store()
+        data = await state.aload()
+        for op in range(args.ops):
+            key = f"w{index}:{op}"
+            data[key] = op
+            started = time.perf_counter()
+            try:
+                data.update(await state.asave(data))
+            except Exception:
+                failed += 1
+                continue
+            finally:
+                save_times.append(time.perf_counter() - started)
+            acked.update(k for k in data if k.startswith(f"w{index}:"))
+        # Keys from failed saves are still in ``data``; keep trying to land them.
+        for _ in range(20):
+            try:
+                data.update(await state.asave(data))
+            except Exception:
+                continue
+            acked.update(k for k in data if k.startswith(f"w{index}:"))
+            break
+
+    async def reader() -> None:
+        state = store()
+        for _ in range(args.reads):
+            started = time.perf_counter()
+            try:
+                await state.aload()
+            except Exception:
+                pass
+            load_times.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(writer(i) for i in range(args.writers)),
+        *(reader() for _ in range(args.readers)),
+    )
+    seconds = time.perf_counter() - started
+    final = store().load()
+    stats = fake.stats
+    return {
+        "profile": name,
+        "knobs": knobs,
+        "writers": args.writers,
+        "readers": args.readers,
+        "seconds": round(seconds, 4),
+        "saves_per_second": round(len(save_times) / seconds, 1),
+        "loads_per_second": round(len(load_times) / seconds, 1),
+        "save": percentiles(save_times),
+        "load": percentiles(load_times),
+        "failed_saves": failed,
+        "requests": stats.requests,
+        "by_operation": stats.by_operation,
+        "throttled": stats.throttled,
+        "errors": stats.errors,
+        "partial": stats.partial,
+        "conflicts": stats.conflicts,
+        "keys": len(final),
+        "lost_writes": len(acked - final.keys()),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--ops", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    args = parser.parse_args()
+
+    # Every writer gets its own executor thread and write slot, as separate
+    # processes would; must be set before solid_funicular.state is imported.
+    os.environ["BOT_STATE_IO_WORKERS"] = str(args.writers + args.readers)
+    os.environ["BOT_STATE_MAX_INFLIGHT_WRITES"] = str(args.writers)
+    os.environ["BOT_STATE_BACKEND"] = "oci"
+    os.environ.setdefault("BOT_STATE_NAMESPACE", "benchmark")
+    os.environ.setdefault("BOT_STATE_BUCKET", "benchmark")
+
+    failed = False
+    for name in args.profiles.split(","):
+        result = asyncio.run(run_profile(name, PROFILES[name], args))
+        print(json.dumps(result), flush=True)
+        failed = failed or result["lost_writes"] > 0
+    if failed:
+        raise SystemExit("lost writes detected")
+
+
+if __name__ == "__main__":
+    main()
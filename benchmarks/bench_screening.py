@@ -0,0 +1,76 @@
+"""Per-message cost of on_message screening.
+
+    python benchmarks/bench_screening.py
+
+Prints one JSON object per (input, screener) pair with the mean time per
+message in microseconds.
+"""
+
+import json
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from solid_funicular.screening import Screener  # noqa: E402
+
+LEGACY = re.compile(r"(.)\1{99,}")
+
+
+def inputs(length: int) -> dict[str, str]:
+    rng = random.Random(length)
+    words = ["山手線", "次は", "hello", "world", "お出口は左側です。", "lol", "😀", "\n"]
+    prose = ""
+    while len(prose) < length:
+        prose += rng.choice(words) + " "
+    return {
+        "prose": prose[:length],
+        "near_miss_runs": ("a" * 99 + "b") * (length // 100),
+        "char_run_spam": prose[: length // 2] + "w" * (length - length // 2),
+        "substring_spam": prose[: length // 2] + ("草生える" * length)[: length // 2],
+    }
+
+
+SCREENERS = {
+    "default": Screener.from_rules({"repeated_char_run": 100}),
+    "all_rules": Screener.from_rules(
+        {
+            "repeated_char_run": 100,
+            "repeated_substring": {"min_length": 400, "max_period": 16},
+            "mention_flood": 20,
+            "max_length": 8000,
+        }
+    ),
+}
+
+
+def bench(fn, content: str) -> float:
+    timer = timeit.Timer(lambda: fn(content))
+    number, _ = timer.autorange()
+    return min(timer.repeat(5, number)) / number * 1e6
+
+
+def main() -> None:
+    for length in (2000, 4000):
+        for input_name, content in inputs(length).items():
+            results = {"legacy_regex": bench(LEGACY.search, content)}
+            for name, screener in SCREENERS.items():
+                results[name] = bench(screener.screen, content)
+            for name, micros in results.items():
+                print(
+                    json.dumps(
+                        {
+                            "length": length,
+                            "input": input_name,
+                            "screener": name,
+                            "us_per_message": round(micros, 2),
+                        }
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Cold-start cost: module import time and time until state is loaded.
+
+    python benchmarks/bench_startup.py [--entries N]
+
+Each import is timed in a fresh interpreter. Time-to-ready is approximated
+by loading the state stores the way Bot.start does (concurrently) and the
+way the bot used to (one after another), against synthetic local JSON
+state. Prints one JSON object per measurement.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC))
+
+from solid_funicular.state import JsonState  # noqa: E402
+
+IMPORT_PROBE = """
+import sys, time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started, "oci" in sys.modules)
+"""
+
+OBJECTS = ["users.json", "punishment.json", "eshiritori.json", "setup.json"]
+
+
+def time_import(module: str, env: dict[str, str], runs: int) -> dict:
+    timings = []
+    loaded_oci = False
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(module=module)],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1]}
+        seconds, oci = result.stdout.split()
+        timings.append(float(seconds))
+        loaded_oci = oci == "True"
+    return {"seconds": round(min(timings), 4), "imports_oci": loaded_oci}
+
+
+def write_state(directory: str, entries: int) -> None:
+    for name in OBJECTS:
+        data = {str(10**17 + i): 10**17 + i // 2 for i in range(entries)}
+        with open(os.path.join(directory, name), "w") as f:
+            json.dump(data, f)
+
+
+async def load_concurrently(stores: list[JsonState]) -> None:
+    await asyncio.gather(*(store.aload() for store in stores))
+
+
+async def load_sequentially(stores: list[JsonState]) -> None:
+    for store in stores:
+        store.load()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=10_000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "PYTHONPATH": str(SRC),
+            "BOT_STATE_BACKEND": "local",
+            # Dummy configuration so solid_funicular.main can be imported.
+            "DISCORD_TOKEN": "benchmark",
+            "GUILD_ID": "1",
+            "MEMBER_ROLE_ID": "1",
+            "ESHIRITORI_CHANNEL_ID": "1",
+            "ARCHIVE_CATEGORY_ID": "1",
+        }
+        for module in ("solid_funicular.state", "solid_funicular.main"):
+            print(
+                json.dumps(
+                    {"measure": "import", "module": module}
+                    | time_import(module, env, args.runs)
+                )
+            )
+
+        write_state(directory, args.entries)
+        for name, loader in (
+            ("sequential", load_sequentially),
+            ("concurrent", load_concurrently),
+        ):
+            stores = [
+                JsonState(os.path.join(directory, o), o) for o in OBJECTS
+            ]
+            started = time.perf_counter()
+            asyncio.run(loader(stores))
+            print(
+                json.dumps(
+                    {
+                        "measure": "state_load",
+                        "mode": name,
+                        "stores": len(stores),
+                        "entries_per_store": args.entries,
+                        "seconds": round(time.perf_counter() - started, 4),
+                    }
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
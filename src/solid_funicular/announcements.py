@@ -0,0 +1,20 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+_DIRECTION = re.compile(r"この電車は、山手線内回り、(.+?)方面行きです。")
+
+
+@dataclass(frozen=True)
+class Announcement:
+    """One station announcement and the nickname the bot takes while it runs."""
+
+    text: str
+    nick: Optional[str] = None
+
+    @classmethod
+    def parse(cls, text: str) -> "Announcement":
+        """Build the table entry once, taking the nickname from the direction."""
+        if m := _DIRECTION.search(text):
+            return cls(text, f"山手線内回り {m.group(1)}方面行き")
+        return cls(text)
@@ -0,0 +1,318 @@
+import asyncio
+import datetime
+import json
+import os
+import socket
+import sys
+import time
+import traceback
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Iterator, Optional
+
+from solid_funicular.state import JsonState, with_retry
+
+SEGMENT_SUFFIX = ".ndjson"
+# Segments still being written; sealing renames them to SEGMENT_SUFFIX.
+OPEN_SUFFIX = ".open.ndjson"
+ARCHIVE_SUFFIX = ".ndjson.zlib"
+READ_CHUNK = 1 << 16
+# How often a writer checks whether its open segment is due to be sealed.
+SEAL_CHECK_INTERVAL = 60.0
+
+
+class AuditLog:
+    """Append-only NDJSON log of moderation actions.
+
+    ``record`` only appends to an in-memory buffer; the buffer is written at
+    most every ``flush_interval`` seconds by a single background thread, so
+    records stay in order and the event loop never waits on the disk. Each
+    writer appends to its own segment, ``audit-<start time>-<host>-<pid>``,
+    and seals it once it reaches ``max_bytes`` or ``max_age`` seconds (and on
+    ``close``). Sealed segments can be zlib-compressed and uploaded to the
+    state bucket under ``audit/``. ``start`` seals what earlier processes
+    left open and checks the open segment's age periodically, so a quiet
+    segment is sealed on time too.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        max_bytes: int = 16 << 20,
+        max_age: float = 24 * 60 * 60,
+        compress: bool = False,
+        upload: bool = False,
+        flush_interval: float = 1.0,
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.upload = upload
+        self.flush_interval = flush_interval
+        self.writer = f"{socket.gethostname()}-{os.getpid()}"
+        self._buffer: list[bytes] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._seal_task: Optional[asyncio.Task] = None
+        # One thread, so batches are appended in the order they were taken.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audit")
+        self._file: Optional[BinaryIO] = None
+        self._path: Optional[str] = None
+        self._opened_at = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["AuditLog"]:
+        directory = os.environ.get("AUDIT_LOG_DIR", os.path.join("data", "audit"))
+        if not directory:
+            return None
+        return cls(
+            directory,
+            max_bytes=int(os.environ.get("AUDIT_LOG_MAX_BYTES", str(16 << 20))),
+            max_age=float(os.environ.get("AUDIT_LOG_MAX_AGE", str(24 * 60 * 60))),
+            compress=os.environ.get("AUDIT_LOG_COMPRESS", "") == "1",
+            upload=os.environ.get("AUDIT_LOG_UPLOAD", "") == "1",
+            flush_interval=float(os.environ.get("AUDIT_LOG_FLUSH_INTERVAL", "1")),
+        )
+
+    def record(self, action: str, guild: int, user: int, **fields: Any) -> None:
+        entry = {"ts": time.time(), "action": action, "guild": guild, "user": user}
+        entry.update(fields)
+        self._buffer.append(json.dumps(entry, ensure_ascii=False).encode() + b"\n")
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_later())
+
+    async def start(self) -> None:
+        """Seal leftover segments, then seal by age in the background."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._seal_leftovers)
+        if self._seal_task is None:
+            self._seal_task = loop.create_task(self._seal_periodically())
+
+    async def _seal_periodically(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(min(SEAL_CHECK_INTERVAL, self.max_age))
+            await loop.run_in_executor(self._executor, self._seal_if_old)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.aflush()
+
+    async def aflush(self) -> None:
+        lines, self._buffer = self._buffer, []
+        if lines:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._append, lines)
+
+    def flush(self) -> None:
+        lines, self._buffer = self._buffer, []
+        if lines:
+            self._executor.submit(self._append, lines).result()
+
+    def close(self) -> None:
+        """Write what is buffered and seal the open segment (blocking)."""
+        for task in (self._flush_task, self._seal_task):
+            if task is not None:
+                task.cancel()
+        self._flush_task = self._seal_task = None
+        self.flush()
+        self._executor.submit(self._seal).result()
+
+    def _append(self, lines: list[bytes]) -> None:
+        if self._file is not None and self._file.tell() >= self.max_bytes:
+            self._seal()
+        self._seal_if_old()
+        if self._file is None:
+            self._open()
+        assert self._file is not None
+        self._file.write(b"".join(lines))
+        self._file.flush()
+
+    def _open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._opened_at = time.time()
+        started = datetime.datetime.fromtimestamp(self._opened_at, datetime.UTC)
+        name = f"audit-{started:%Y%m%dT%H%M%S%fZ}-{self.writer}{OPEN_SUFFIX}"
+        self._path = os.path.join(self.directory, name)
+        self._file = open(self._path, "ab")
+
+    def _seal_if_old(self) -> None:
+        if self._file is not None and time.time() - self._opened_at >= self.max_age:
+            self._seal()
+
+    def _seal(self) -> None:
+        if self._file is None or self._path is None:
+            return
+        os.fsync(self._file.fileno())
+        self._file.close()
+        path, self._file, self._path = self._path, None, None
+        self._finish(path)
+
+    def _seal_leftovers(self) -> None:
+        """Seal segments left open by writers that are gone.
+
+        A writer on this host is gone if its process is; one elsewhere if its
+        segment has gone unwritten for longer than any writer keeps one open.
+        """
+        if not os.path.isdir(self.directory):
+            return
+        host = socket.gethostname()
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(OPEN_SUFFIX) or path == self._path:
+                continue
+            # audit-<start time>-<host>-<pid>.open.ndjson
+            writer = name[: -len(OPEN_SUFFIX)].split("-", 2)[-1]
+            writer_host, _, pid = writer.rpartition("-")
+            if writer_host == host and pid.isdigit():
+                gone = int(pid) == os.getpid() or not _running(int(pid))
+            else:
+                idle = time.time() - os.path.getmtime(path)
+                gone = idle > self.max_age + SEAL_CHECK_INTERVAL
+            if not gone:
+                continue
+            try:
+                self._finish(path)
+            except FileNotFoundError:
+                # Another process starting up sealed it first.
+                continue
+
+    def _finish(self, path: str) -> None:
+        sealed = path[: -len(OPEN_SUFFIX)] + SEGMENT_SUFFIX
+        os.replace(path, sealed)
+        path = sealed
+        try:
+            if self.compress:
+                path = compress_segment(path)
+            if self.upload:
+                upload_segment(path)
+        except Exception:
+            # The segment stays on disk; nothing is lost.
+            traceback.print_exc()
+
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def compress_segment(path: str) -> str:
+    """Replace ``path`` with a zlib-compressed copy, streaming; returns its path."""
+    archive = path[: -len(SEGMENT_SUFFIX)] + ARCHIVE_SUFFIX
+    compressor = zlib.compressobj(9)
+    with open(path, "rb") as src, open(f"{archive}.tmp", "wb") as dst:
+        while chunk := src.read(READ_CHUNK):
+            dst.write(compressor.compress(chunk))
+        dst.write(compressor.flush())
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(f"{archive}.tmp", archive)
+    os.remove(path)
+    return archive
+
+
+def upload_segment(path: str) -> None:
+    """Put a sealed segment in the state bucket as ``audit/<file name>``."""
+    store = JsonState(path, f"audit/{os.path.basename(path)}")
+    if not store.bucket or not store.namespace:
+        raise RuntimeError(
+            "AUDIT_LOG_UPLOAD needs BOT_STATE_BUCKET and BOT_STATE_NAMESPACE"
+        )
+    with open(path, "rb") as f:
+        body = f.read()
+    with_retry(
+        store.client.put_object,
+        store.namespace,
+        store.bucket,
+        store.key,
+        body,
+        content_type="application/x-ndjson",
+    )
+
+
+def _lines(path: str) -> Iterator[bytes]:
+    if not path.endswith(ARCHIVE_SUFFIX):
+        with open(path, "rb") as f:
+            yield from f
+        return
+    decompressor = zlib.decompressobj()
+    pending = b""
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_CHUNK):
+            pending += decompressor.decompress(chunk)
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line
+    pending += decompressor.flush()
+    yield from pending.split(b"\n")
+
+
+def read(
+    directory: str,
+    *,
+    user: Optional[int] = None,
+    action: Optional[str] = None,
+    guild: Optional[int] = None,
+) -> Iterator[dict[str, Any]]:
+    """Records in ``directory``, oldest segment first, one at a time.
+
+    Lines are checked for the filter values as bytes before being parsed, so
+    skipping records costs little more than reading them.
+    """
+    names = sorted(
+        n
+        for n in os.listdir(directory)
+        if n.startswith("audit-") and n.endswith((SEGMENT_SUFFIX, ARCHIVE_SUFFIX))
+    )
+    needles = [str(v).encode() for v in (user, action, guild) if v is not None]
+    for name in names:
+        for line in _lines(os.path.join(directory, name)):
+            if not line.strip() or not all(n in line for n in needles):
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # The tail of a segment whose writer crashed mid-line.
+                continue
+            if (
+                (user is None or entry.get("user") == user)
+                and (action is None or entry.get("action") == action)
+                and (guild is None or entry.get("guild") == guild)
+            ):
+                yield entry
+
+
+def main(argv: list[str]) -> None:
+    """``python -m solid_funicular.audit [--user ID] [--action A] [--guild ID] [dir]``
+
+    Prints the matching audit records as NDJSON.
+    """
+    filters: dict[str, Any] = {}
+    directory = os.environ.get("AUDIT_LOG_DIR") or os.path.join("data", "audit")
+    args = iter(argv)
+    for arg in args:
+        if arg in ("--user", "--guild"):
+            filters[arg[2:]] = int(next(args))
+        elif arg == "--action":
+            filters["action"] = next(args)
+        elif arg.startswith("-"):
+            raise SystemExit(main.__doc__)
+        else:
+            directory = arg
+    for entry in read(directory, **filters):
+        sys.stdout.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,98 @@
+import asyncio
+import time
+import traceback
+from typing import (
+    Awaitable,
+    Callable,
+    Generic,
+    Hashable,
+    Iterable,
+    Optional,
+    TypeVar,
+)
+
+K = TypeVar("K", bound=Hashable)
+
+
+class Coalescer(Generic[K]):
+    """Collects keys and hands them to ``handler`` in batches.
+
+    The first key queued starts a ``window``-second timer; every key added
+    before it fires is handled once, in the same batch.
+    """
+
+    def __init__(
+        self, handler: Callable[[set[K]], Awaitable[None]], window: float
+    ) -> None:
+        self.handler = handler
+        self.window = window
+        self.pending: set[K] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, *keys: K) -> None:
+        if not keys:
+            return
+        self.pending.update(keys)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        await asyncio.sleep(self.window)
+        while self.pending:
+            batch, self.pending = self.pending, set()
+            try:
+                await self.handler(batch)
+            except Exception:
+                traceback.print_exc()
+
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second on average, bursting to ``burst``."""
+
+    def __init__(self, rate: float, burst: float = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+async def run_pool(
+    items: Iterable[T],
+    worker: Callable[[T], Awaitable[None]],
+    concurrency: int,
+    limiter: Optional[TokenBucket] = None,
+) -> None:
+    """Run ``worker`` over ``items`` with at most ``concurrency`` in flight.
+
+    Items are pulled lazily, so huge iterables are never materialized as
+    tasks. A failing item is logged and does not stop the others.
+    """
+    it = iter(items)
+
+    async def drain() -> None:
+        for item in it:
+            if limiter is not None:
+                await limiter.acquire()
+            try:
+                await worker(item)
+            except Exception:
+                traceback.print_exc()
+
+    await asyncio.gather(*(drain() for _ in range(max(1, concurrency))))
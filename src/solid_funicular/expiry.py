@@ -0,0 +1,87 @@
+import asyncio
+import heapq
+import time
+import traceback
+from typing import Awaitable, Callable, Mapping, Optional
+
+
+class ExpiryScheduler:
+    """Fires ``on_expire(key)`` when each key's deadline (epoch seconds) passes.
+
+    Deadlines live in a min-heap, so scheduling is O(log n) and the runner
+    sleeps until the earliest one instead of polling. Cancelled or
+    rescheduled keys leave stale heap entries behind that are skipped when
+    popped and compacted away once they outnumber the live ones.
+    """
+
+    def __init__(self, on_expire: Callable[[str], Awaitable[None]]) -> None:
+        self.on_expire = on_expire
+        self.deadlines: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+    def rebuild(self, deadlines: Mapping[str, float]) -> None:
+        self.deadlines = {k: float(v) for k, v in deadlines.items()}
+        self._heap = [(v, k) for k, v in self.deadlines.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def schedule(self, key: str, deadline: float) -> None:
+        deadline = float(deadline)
+        if self.deadlines.get(key) == deadline:
+            return
+        self.deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if self._heap[0] == (deadline, key):
+            self._wakeup.set()
+        self._compact()
+
+    def cancel(self, key: str) -> None:
+        if self.deadlines.pop(key, None) is not None:
+            self._compact()
+
+    def next_deadline(self) -> Optional[float]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _drop_stale(self) -> None:
+        heap = self._heap
+        while heap and self.deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def _compact(self) -> None:
+        if len(self._heap) > 2 * len(self.deadlines) + 64:
+            self._heap = [(v, k) for k, v in self.deadlines.items()]
+            heapq.heapify(self._heap)
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            deadline = self.next_deadline()
+            now = time.time()
+            if deadline is None or deadline > now:
+                timeout = None if deadline is None else deadline - now
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, key = heapq.heappop(self._heap)
+            del self.deadlines[key]
+            try:
+                await self.on_expire(key)
+            except Exception:
+                traceback.print_exc()
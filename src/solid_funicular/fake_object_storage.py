@@ -0,0 +1,188 @@
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+
+class FakeServiceError(Exception):
+    """Stand-in for ``oci.exceptions.ServiceError`` (same status/code/message)."""
+
+    def __init__(self, status: int, code: str, message: str = "") -> None:
+        super().__init__(f"{status} {code}: {message}")
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+@dataclass
+class _Data:
+    content: bytes
+
+
+@dataclass
+class _Response:
+    status: int
+    headers: dict[str, str]
+    data: Optional[_Data] = None
+
+
+@dataclass
+class FaultStats:
+    requests: int = 0
+    throttled: int = 0
+    errors: int = 0
+    partial: int = 0
+    conflicts: int = 0
+    by_operation: dict[str, int] = field(default_factory=dict)
+
+
+class FakeObjectStorage:
+    """In-process fake of the Object Storage calls JsonState makes.
+
+    Implements ``get_object`` and ``put_object`` with ETags, 404 for missing
+    objects and 412 for failed ``if_match`` / ``if_none_match`` conditions.
+    Objects live in memory, or under ``directory`` so they survive restarts.
+    Faults are injected per request: ``latency`` seconds (plus up to
+    ``jitter``), 429 with probability ``throttle_rate``, 503 with
+    ``error_rate``, and with ``partial_rate`` a PUT that is stored but still
+    answered with a 503, as when the response is lost.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        throttle_rate: float = 0.0,
+        error_rate: float = 0.0,
+        partial_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.directory = directory
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.partial_rate = partial_rate
+        self.stats = FaultStats()
+        self._objects: dict[tuple[str, str, str], tuple[bytes, str]] = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_env(cls) -> "FakeObjectStorage":
+        """Configured by ``BOT_STATE_OCI_FAKE`` ("memory" or a directory) and
+        the ``BOT_STATE_OCI_FAKE_*`` fault knobs."""
+        location = os.environ.get("BOT_STATE_OCI_FAKE", "memory")
+
+        def knob(name: str) -> float:
+            return float(os.environ.get(f"BOT_STATE_OCI_FAKE_{name}", "0"))
+
+        return cls(
+            None if location == "memory" else location,
+            latency=knob("LATENCY"),
+            jitter=knob("JITTER"),
+            throttle_rate=knob("THROTTLE_RATE"),
+            error_rate=knob("ERROR_RATE"),
+            partial_rate=knob("PARTIAL_RATE"),
+        )
+
+    def get_object(self, namespace_name: str, bucket_name: str, object_name: str):
+        self._request("get_object")
+        with self._lock:
+            stored = self._read((namespace_name, bucket_name, object_name))
+        if stored is None:
+            raise FakeServiceError(404, "ObjectNotFound", object_name)
+        content, etag = stored
+        return _Response(200, {"etag": etag}, _Data(content))
+
+    def put_object(
+        self,
+        namespace_name: str,
+        bucket_name: str,
+        object_name: str,
+        put_object_body: bytes,
+        *,
+        content_type: Optional[str] = None,
+        if_match: Optional[str] = None,
+        if_none_match: Optional[str] = None,
+        **kwargs: Any,
+    ):
+        self._request("put_object")
+        key = (namespace_name, bucket_name, object_name)
+        with self._lock:
+            stored = self._read(key)
+            current = stored[1] if stored is not None else None
+            if (if_match is not None and current != if_match) or (
+                if_none_match == "*" and current is not None
+            ):
+                self.stats.conflicts += 1
+                raise FakeServiceError(412, "IfMatchFailed", object_name)
+            etag = uuid.uuid4().hex
+            self._write(key, bytes(put_object_body), etag)
+            if self._random.random() < self.partial_rate:
+                self.stats.partial += 1
+                raise FakeServiceError(503, "ServiceUnavailable", "response lost")
+        return _Response(200, {"etag": etag})
+
+    def _request(self, operation: str) -> None:
+        with self._lock:
+            self.stats.requests += 1
+            by_operation = self.stats.by_operation
+            by_operation[operation] = by_operation.get(operation, 0) + 1
+            roll = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if roll < self.throttle_rate:
+            with self._lock:
+                self.stats.throttled += 1
+            raise FakeServiceError(429, "TooManyRequests")
+        if roll < self.throttle_rate + self.error_rate:
+            with self._lock:
+                self.stats.errors += 1
+            raise FakeServiceError(503, "ServiceUnavailable")
+
+    def _path(self, key: tuple[str, str, str]) -> str:
+        assert self.directory is not None
+        return os.path.join(self.directory, *key)
+
+    def _read(self, key: tuple[str, str, str]) -> Optional[tuple[bytes, str]]:
+        if self.directory is None:
+            return self._objects.get(key)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            with open(f"{path}.etag", "r") as f:
+                return content, f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: tuple[str, str, str], content: bytes, etag: str) -> None:
+        if self.directory is None:
+            self._objects[key] = (content, etag)
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for target, body in ((path, content), (f"{path}.etag", etag.encode())):
+            with open(f"{target}.tmp", "wb") as f:
+                f.write(body)
+            os.replace(f"{target}.tmp", target)
+
+
+_shared: Optional[FakeObjectStorage] = None
+_shared_lock = threading.Lock()
+
+
+def shared_from_env() -> FakeObjectStorage:
+    """One fake per process, so every JsonState sees the same objects."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = FakeObjectStorage.from_env()
+        return _shared
@@ -0,0 +1,106 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Optional
+
+# Where the announcements went before they were configurable.
+LEGACY_ANNOUNCE_GUILD_ID = "1181575958730391642"
+LEGACY_ANNOUNCE_CHANNEL_ID = "1181589574993064007"
+LEGACY_ANNOUNCE_MENTION = "<@!600922778509770754>"
+
+
+def _optional_int(value: Any) -> Optional[int]:
+    return int(value) if value not in (None, "") else None
+
+
+@dataclass
+class GuildConfig:
+    """What the bot does in one guild.
+
+    ``moderated`` enables moderation (commands, verification, punishments);
+    in a guilds file it defaults to whether ``member_role_id`` is set, which
+    only /setup needs. State lives under ``state_prefix``; an empty prefix is
+    the original single-guild layout (``data/users.json``).
+    """
+
+    id: int
+    member_role_id: Optional[int] = None
+    eshiritori_channel_id: Optional[int] = None
+    archive_category_id: Optional[int] = None
+    announce_channel_id: Optional[int] = None
+    announce_mention: str = ""
+    state_prefix: Optional[str] = None
+    moderated: bool = False
+
+    def __post_init__(self) -> None:
+        if self.state_prefix is None:
+            self.state_prefix = f"guilds/{self.id}"
+
+    def state_paths(self, name: str) -> tuple[str, str]:
+        """Local path and object name of the state object ``name`` (e.g. users.json)."""
+        object_name = f"{self.state_prefix}/{name}" if self.state_prefix else name
+        return os.path.join("data", object_name), object_name
+
+    @classmethod
+    def from_dict(cls, guild_id: int | str, config: dict[str, Any]) -> "GuildConfig":
+        member_role_id = _optional_int(config.get("member_role_id"))
+        return cls(
+            id=int(guild_id),
+            member_role_id=member_role_id,
+            eshiritori_channel_id=_optional_int(config.get("eshiritori_channel_id")),
+            archive_category_id=_optional_int(config.get("archive_category_id")),
+            announce_channel_id=_optional_int(config.get("announce_channel_id")),
+            announce_mention=config.get("announce_mention", ""),
+            state_prefix=config.get("state_prefix"),
+            moderated=config.get("moderated", member_role_id is not None),
+        )
+
+
+def load_guild_configs() -> dict[int, GuildConfig]:
+    """Per-guild configuration.
+
+    ``GUILDS_CONFIG`` names a JSON file ``{"<guild id>": {"member_role_id": ...,
+    ...}}`` with the fields of GuildConfig. Without it, the single-guild
+    variables (GUILD_ID, MEMBER_ROLE_ID, ESHIRITORI_CHANNEL_ID,
+    ARCHIVE_CATEGORY_ID, ANNOUNCE_*) describe one moderated guild with the
+    original state layout, as before even without MEMBER_ROLE_ID, plus the
+    announcement guild if it is another one.
+    """
+    path = os.environ.get("GUILDS_CONFIG")
+    if path:
+        with open(path, "r") as f:
+            return {
+                int(k): GuildConfig.from_dict(k, v) for k, v in json.load(f).items()
+            }
+    guild_id = int(os.environ["GUILD_ID"])
+    configs = {
+        guild_id: GuildConfig(
+            id=guild_id,
+            member_role_id=_optional_int(os.environ.get("MEMBER_ROLE_ID")),
+            eshiritori_channel_id=_optional_int(
+                os.environ.get("ESHIRITORI_CHANNEL_ID")
+            ),
+            archive_category_id=_optional_int(os.environ.get("ARCHIVE_CATEGORY_ID")),
+            state_prefix="",
+            moderated=True,
+        )
+    }
+    announce_guild_id = _optional_int(
+        os.environ.get("ANNOUNCE_GUILD_ID", LEGACY_ANNOUNCE_GUILD_ID)
+    )
+    if announce_guild_id is not None:
+        config = configs.setdefault(
+            announce_guild_id, GuildConfig(id=announce_guild_id)
+        )
+        config.announce_channel_id = _optional_int(
+            os.environ.get("ANNOUNCE_CHANNEL_ID", LEGACY_ANNOUNCE_CHANNEL_ID)
+        )
+        config.announce_mention = os.environ.get(
+            "ANNOUNCE_MENTION", LEGACY_ANNOUNCE_MENTION
+        )
+    return configs
+
+
+def shard_id_for(guild_id: int, shard_count: int) -> int:
+    """The shard Discord routes ``guild_id``'s events to."""
+    return (guild_id >> 22) % shard_count
@@ -0,0 +1,56 @@
+import bisect
+from typing import Any, Iterator, Mapping
+
+
+class HistoryIndex:
+    """Indexes of punishment-history entries: by start time and by user.
+
+    Keys are kept sorted by start time next to a parallel list of start
+    times, so ``between`` is two bisections plus the entries it yields
+    (O(log n + k)). Entries are recorded as they happen, so adding one is
+    almost always an append. Each user's keys are kept in start order too.
+    """
+
+    def __init__(self) -> None:
+        self._starts: list[float] = []
+        self._keys: list[str] = []
+        self._start_of: dict[str, float] = {}
+        self._by_user: dict[int, list[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def rebuild(self, entries: Mapping[str, Mapping[str, Any]]) -> None:
+        ordered = sorted(entries.items(), key=lambda kv: (kv[1]["start"], kv[0]))
+        self._starts = [float(entry["start"]) for _, entry in ordered]
+        self._keys = [key for key, _ in ordered]
+        self._start_of = dict(zip(self._keys, self._starts))
+        self._by_user = {}
+        for key, entry in ordered:
+            self._by_user.setdefault(int(entry["user"]), []).append(key)
+
+    def add(self, key: str, entry: Mapping[str, Any]) -> None:
+        """Index an entry; entries keep their start time, so updates are no-ops."""
+        if key in self._start_of:
+            return
+        start = float(entry["start"])
+        position = bisect.bisect_right(self._starts, start)
+        self._starts.insert(position, start)
+        self._keys.insert(position, key)
+        self._start_of[key] = start
+        keys = self._by_user.setdefault(int(entry["user"]), [])
+        keys.insert(bisect.bisect_right(keys, start, key=self._start_of.get), key)
+
+    def between(
+        self, start: float, end: float, newest_first: bool = False
+    ) -> Iterator[str]:
+        """Keys of entries that started in [start, end]."""
+        low = bisect.bisect_left(self._starts, start)
+        high = bisect.bisect_right(self._starts, end)
+        positions = range(high - 1, low - 1, -1) if newest_first else range(low, high)
+        for position in positions:
+            yield self._keys[position]
+
+    def for_user(self, user_id: int) -> list[str]:
+        """Keys of ``user_id``'s entries, oldest first."""
+        return self._by_user.get(user_id, [])
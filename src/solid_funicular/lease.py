@@ -0,0 +1,110 @@
+import asyncio
+import os
+import socket
+import time
+import traceback
+from typing import Awaitable, Callable, Optional
+
+from solid_funicular.state import JsonState
+
+
+class Lease:
+    """Leader election through a lease object in the state store.
+
+    The lease is ``{"holder", "expires", "term"}`` in a JsonState object and
+    is only ever changed with ``write_if``, so two replicas cannot both win.
+    The holder renews it every ``ttl / 3`` seconds; others poll as often and
+    take it over once ``expires`` (epoch seconds, so replica clocks must be
+    roughly in sync) has passed. A holder that cannot renew steps down when
+    its own copy of the deadline passes, before anyone else can acquire.
+
+    With ``ttl`` 0 the lease is disabled and this replica always leads.
+    """
+
+    def __init__(
+        self,
+        store: JsonState,
+        ttl: float,
+        on_acquire: Callable[[], Awaitable[None]],
+        on_release: Callable[[], Awaitable[None]],
+        holder: Optional[str] = None,
+    ) -> None:
+        self.store = store
+        self.ttl = ttl
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = not self.enabled
+        self.term = 0
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def start(self) -> None:
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        interval = self.ttl / 3
+        loop = asyncio.get_running_loop()
+        while True:
+            started = time.monotonic()
+            try:
+                held = await asyncio.wait_for(
+                    loop.run_in_executor(None, self._try_acquire),
+                    interval,
+                )
+            except Exception:
+                traceback.print_exc()
+                held = None
+            if held:
+                # Counted from before the request, so we give up first.
+                self._valid_until = started + self.ttl
+            still_valid = time.monotonic() < self._valid_until
+            if held or (held is None and self.is_leader and still_valid):
+                if not self.is_leader:
+                    print(f"Lease acquired by {self.holder} (term {self.term})")
+                    self.is_leader = True
+                    await self._callback(self.on_acquire)
+            elif self.is_leader:
+                print(f"Lease lost by {self.holder}")
+                self.is_leader = False
+                await self._callback(self.on_release)
+            await asyncio.sleep(max(0.0, started + interval - time.monotonic()))
+
+    async def _callback(self, callback: Callable[[], Awaitable[None]]) -> None:
+        try:
+            await callback()
+        except Exception:
+            traceback.print_exc()
+
+    def _try_acquire(self) -> bool:
+        record, version = self.store.read_versioned()
+        now = time.time()
+        holder = record.get("holder")
+        if holder not in (None, self.holder) and record.get("expires", 0) > now:
+            return False
+        term = record.get("term", 0)
+        if holder != self.holder:
+            term += 1
+        acquired = self.store.write_if(
+            {"holder": self.holder, "expires": now + self.ttl, "term": term}, version
+        )
+        if acquired:
+            self.term = term
+        return acquired
+
+    def release(self) -> None:
+        """Give the lease up at once (blocking), so a standby needn't wait it out."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if not self.enabled or not self.is_leader:
+            return
+        self.is_leader = False
+        record, version = self.store.read_versioned()
+        if record.get("holder") == self.holder:
+            self.store.write_if({**record, "expires": 0}, version)
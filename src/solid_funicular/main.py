@@ -1,17 +1,35 @@
+import asyncio
 import datetime
-import itertools
+import logging
 import os
 import random
-import re
 import time
-from io import BytesIO
+import traceback
+from collections.abc import Sequence
 from typing import Any, Optional
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands, pages, tasks
 from discord.ui import Button, View
 from dotenv import load_dotenv
+from solid_funicular import metrics
+from solid_funicular.announcements import Announcement
+from solid_funicular.audit import AuditLog
+from solid_funicular.batching import Coalescer, TokenBucket, run_pool
+from solid_funicular.expiry import ExpiryScheduler
+from solid_funicular.guilds import GuildConfig, load_guild_configs, shard_id_for
+from solid_funicular.history import HistoryIndex
+from solid_funicular.lease import Lease
+from solid_funicular.members import MemberCache
+from solid_funicular.outbound import OutboundQueue, Priority
+from solid_funicular.roles import (
+    DEFAULT_PRIVILEGED_PERMISSIONS,
+    PrivilegedRoleIndex,
+    permission_mask,
+)
+from solid_funicular.screening import ScreeningConfig
 from solid_funicular.state import JsonState
+from solid_funicular.transfer import TransferTooLarge, fetch_attachments
 
 # Only load .env if not running under systemd (for development)
 if not os.environ.get('DISCORD_TOKEN'):
@@ -23,29 +41,540 @@ intents.message_content = True
 admin_only = discord.Permissions()
 admin_only.administrator = True
 
-bot = commands.Bot(intents=intents)
+COMMAND_SECONDS = metrics.Histogram(
+    "solid_funicular_command_seconds",
+    "Application command handler latency.",
+    ("command", "type", "status"),
+)
+REST_SECONDS = metrics.Histogram(
+    "solid_funicular_rest_request_seconds",
+    "Discord REST request latency, including rate-limit retries.",
+    ("method", "route", "status"),
+)
+REST_RATE_LIMITED = metrics.Counter(
+    "solid_funicular_rest_rate_limited",
+    "429 responses from Discord per rate-limit bucket route.",
+    ("route",),
+)
+
+
+class RateLimitCounter(logging.Filter):
+    """Counts the rate-limit warnings discord.http logs before retrying.
+
+    A filter rather than a handler, so records are still passed on to
+    whatever handles them (``logging.lastResort`` if nothing is configured).
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = str(record.msg)
+        if "Global rate limit" in message:
+            REST_RATE_LIMITED.inc("global")
+        elif "rate limited" in message and len(record.args or ()) >= 2:
+            # Buckets are "<channel_id>:<guild_id>:<route path>".
+            REST_RATE_LIMITED.inc(str(record.args[1]).split(":", 2)[-1])
+        return True
+
+
+class Bot(commands.AutoShardedBot):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._command_started: dict[int, float] = {}
+        request = self.http.request
+
+        async def timed_request(route: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                return await request(route, **kwargs)
+            except discord.HTTPException as error:
+                status = str(error.status)
+                raise
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                REST_SECONDS.observe(
+                    time.perf_counter() - started, route.method, route.path, status
+                )
+
+        self.http.request = timed_request
+        rate_limit_logger = logging.getLogger("discord.http")
+        rate_limit_logger.addFilter(RateLimitCounter())
+        if rate_limit_logger.getEffectiveLevel() > logging.WARNING:
+            rate_limit_logger.setLevel(logging.WARNING)
+
+    async def start(self, token: str, *, reconnect: bool = True) -> None:
+        # State is loaded here rather than at import: all stores in parallel,
+        # overlapped with the login request, and before any gateway event.
+        started = time.perf_counter()
+        await asyncio.gather(self.login(token), load_state())
+        print(f"State loaded in {time.perf_counter() - started:.2f}s")
+        await metrics.start_from_env()
+        if audit_log is not None:
+            await audit_log.start()
+        leader.start()
+        if leader.enabled:
+            refresh_standby.start()
+        await self.connect(reconnect=reconnect)
+
+    def dispatch(self, event_name: str, *args: Any, **kwargs: Any) -> None:
+        # A standby replica keeps its gateway caches current but handles
+        # nothing (commands, messages, member events) until it leads.
+        if not leader.is_leader and event_name not in STANDBY_EVENTS:
+            return
+        super().dispatch(event_name, *args, **kwargs)
+
+    def _observe_command(self, ctx: discord.ApplicationContext, status: str) -> None:
+        started = self._command_started.pop(ctx.interaction.id, None)
+        if started is None or ctx.command is None:
+            return
+        COMMAND_SECONDS.observe(
+            time.perf_counter() - started,
+            ctx.command.qualified_name,
+            type(ctx.command).__name__,
+            status,
+        )
+
+    async def on_application_command(self, ctx: discord.ApplicationContext) -> None:
+        self._command_started[ctx.interaction.id] = time.perf_counter()
+
+    async def on_application_command_completion(
+        self, ctx: discord.ApplicationContext
+    ) -> None:
+        self._observe_command(ctx, "ok")
+
+    async def on_application_command_error(
+        self, ctx: discord.ApplicationContext, exception: discord.DiscordException
+    ) -> None:
+        self._observe_command(ctx, "error")
+        await super().on_application_command_error(ctx, exception)
+
+
+# SHARD_COUNT / SHARD_IDS (e.g. "0,1"): run only some shards in this process.
+# By default one process runs every shard Discord recommends.
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT") or 0) or None
+SHARD_IDS = [int(s) for s in os.environ.get("SHARD_IDS", "").split(",") if s.strip()]
+# MEMBER_CACHE=lean: don't chunk guilds or cache every member; only members
+# the bot acts on (punished users and their alts) are kept, up to
+# MEMBER_CACHE_SIZE, and others are fetched when needed.
+LEAN_MEMBER_CACHE = os.environ.get("MEMBER_CACHE", "full") == "lean"
+member_cache = MemberCache(
+    LEAN_MEMBER_CACHE, int(os.environ.get("MEMBER_CACHE_SIZE", "10000"))
+)
+bot = Bot(
+    intents=intents,
+    shard_count=SHARD_COUNT,
+    shard_ids=SHARD_IDS or None,
+    chunk_guilds_at_startup=not LEAN_MEMBER_CACHE,
+    member_cache_flags=(
+        discord.MemberCacheFlags.none()
+        if LEAN_MEMBER_CACHE
+        else discord.MemberCacheFlags.from_intents(intents)
+    ),
+)
+
+
+def is_local(guild_id: int) -> bool:
+    """Whether ``guild_id``'s events are delivered to this process's shards."""
+    if not SHARD_IDS or SHARD_COUNT is None:
+        return True
+    return shard_id_for(guild_id, SHARD_COUNT) in SHARD_IDS
+
+
+# Channel sends are limited to 5 per 5 seconds per channel by Discord.
+outbound = OutboundQueue(
+    max_pending=int(os.environ.get("OUTBOUND_MAX_PENDING", "500")),
+    workers=int(os.environ.get("OUTBOUND_WORKERS", "4")),
+    rate=float(os.environ.get("OUTBOUND_RATE", "1")),
+    burst=float(os.environ.get("OUTBOUND_BURST", "5")),
+)
 
 
 class FileDict(dict):
-    def __init__(self, path: str, object_name: str) -> None:
+    """dict persisted through JsonState.
+
+    With a positive flush interval (``BOT_STATE_FLUSH_INTERVAL`` seconds,
+    default 5) mutations only mark the dict dirty and a background task writes
+    it at most once per interval. An interval of 0 writes on the next loop
+    iteration, coalescing only mutations made in the same tick. Incremental
+    backends (SQLite) are only sent the keys changed since the last write.
+    """
+
+    def __init__(
+        self, path: str, object_name: str, flush_interval: Optional[float] = None
+    ) -> None:
         self.store = JsonState(path, object_name)
-        self.update(self.store.load())
+        if flush_interval is None:
+            flush_interval = float(os.environ.get("BOT_STATE_FLUSH_INTERVAL", "5"))
+        self.flush_interval = flush_interval
+        self.dirty = False
+        # Set on standby replicas, which must not write shared state.
+        self.read_only = False
+        self._changed: set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        # Resolved when the write under way finishes, successful or not.
+        self._writing: Optional[asyncio.Future] = None
+
+    def load(self) -> None:
+        self._replace(self.store.load())
+
+    async def aload(self) -> None:
+        self._replace(await self.store.aload())
+
+    def _replace(self, data: dict[str, Any]) -> None:
+        # Loading replaces the contents, so it can also refresh a standby.
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._flush_task = None
+        super().clear()
+        super().update(data)
+        self.dirty = False
+        self._changed = set()
 
     def __setitem__(self, key: str, value: Any) -> None:
         super().__setitem__(key, value)
-        self.store.save(self)
+        self._changed.add(key)
+        self._mark_dirty()
 
     def __delitem__(self, key: str) -> None:
         super().__delitem__(key)
-        self.store.save(self)
+        self._changed.add(key)
+        self._mark_dirty()
+
+    def _mark_dirty(self) -> None:
+        self.dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside the event loop there is nothing to flush in the background.
+            self.flush()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self._write()
+        except Exception:
+            traceback.print_exc()
+        self._flush_task = None
+        if self.dirty:
+            self._mark_dirty()
+
+    async def _write(self) -> None:
+        # A write under way may carry our changes but has already cleared
+        # dirty; wait for it, so returning still means they are stored.
+        while self._writing is not None:
+            await asyncio.shield(self._writing)
+        if not self.dirty or self.read_only:
+            return
+        self.dirty = False
+        changed, self._changed = self._changed, set()
+        self._writing = asyncio.get_running_loop().create_future()
+        try:
+            if self.store.incremental:
+                await self.store.asave_changes(*self._split(changed))
+                return
+            snapshot = dict(self)
+            stored = await self.store.asave(snapshot)
+        except BaseException:
+            self.dirty = True
+            self._changed |= changed
+            raise
+        finally:
+            self._writing.set_result(None)
+            self._writing = None
+        self._absorb(snapshot, stored)
+
+    def flush(self) -> None:
+        if not self.dirty or self.read_only:
+            return
+        self.dirty = False
+        changed, self._changed = self._changed, set()
+        try:
+            if self.store.incremental:
+                self.store.save_changes(*self._split(changed))
+                return
+            snapshot = dict(self)
+            stored = self.store.save(snapshot)
+        except Exception:
+            self.dirty = True
+            self._changed |= changed
+            raise
+        self._absorb(snapshot, stored)
+
+    def _split(self, changed: set[str]) -> tuple[dict[str, Any], set[str]]:
+        updates = {k: self[k] for k in changed if k in self}
+        return updates, changed - updates.keys()
+
+    def _absorb(self, snapshot: dict[str, Any], stored: dict[str, Any]) -> None:
+        # Pick up keys another writer changed, unless we touched them since.
+        if stored == snapshot:
+            return
+        missing = object()
+        for key in snapshot.keys() | stored.keys():
+            theirs = stored.get(key, missing)
+            mine = snapshot.get(key, missing)
+            if theirs == mine or self.get(key, missing) != mine:
+                continue
+            if theirs is missing:
+                super().__delitem__(key)
+            else:
+                super().__setitem__(key, theirs)
 
+    async def aflush(self) -> None:
+        task = self._flush_task
+        if (
+            task is not None
+            and task is not asyncio.current_task()
+            and not task.done()
+            and self._writing is None
+        ):
+            # Only a task still sleeping is cancelled; a write is waited for.
+            task.cancel()
+        self._flush_task = None
+        await self._write()
+        if self.dirty and self._flush_task is None:
+            self._mark_dirty()
+
+
+class HistoryDict(FileDict):
+    """FileDict of every punishment, ``"<start>:<user ID>"`` -> entry.
+
+    Entries are ``{"user", "start", "until", "actor"}`` plus ``"ended"`` and
+    ``"reason"`` (forgive, expire, or extended by another Punish) once the
+    punishment is over; they are never deleted. ``index`` answers time-range
+    and per-user queries.
+    """
+
+    def __init__(self, path: str, object_name: str) -> None:
+        super().__init__(path, object_name)
+        self.index = HistoryIndex()
+
+    def load(self) -> None:
+        super().load()
+        self.index.rebuild(self)
+
+    async def aload(self) -> None:
+        await super().aload()
+        self.index.rebuild(self)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        super().__setitem__(key, value)
+        self.index.add(key, value)
+
+    def _absorb(self, snapshot: dict[str, Any], stored: dict[str, Any]) -> None:
+        super()._absorb(snapshot, stored)
+        if stored != snapshot:
+            self.index.rebuild(self)
 
-users = FileDict("data/users.json", "users.json")
-punishment = FileDict("data/punishment.json", "punishment.json")
+    def record(
+        self, user_id: int, start: float, until: float, actor: Optional[int]
+    ) -> None:
+        self[f"{start:.6f}:{user_id}"] = {
+            "user": user_id,
+            "start": start,
+            "until": until,
+            "actor": actor,
+        }
+
+    def end(self, user_id: int, reason: str, ended: float) -> None:
+        keys = self.index.for_user(user_id)
+        if keys and "ended" not in self[keys[-1]]:
+            self[keys[-1]] = {**self[keys[-1]], "ended": ended, "reason": reason}
+
+
+class PunishmentDict(FileDict):
+    """FileDict of user ID -> expiry that deletes entries as they expire."""
+
+    def __init__(
+        self, path: str, object_name: str, guild_id: int, history: HistoryDict
+    ) -> None:
+        super().__init__(path, object_name)
+        self.guild_id = guild_id
+        self.history = history
+        self.expiry = ExpiryScheduler(self._expire)
+
+    def load(self) -> None:
+        super().load()
+        self.expiry.rebuild(self)
+
+    async def aload(self) -> None:
+        await super().aload()
+        self.expiry.rebuild(self)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        super().__setitem__(key, value)
+        self.expiry.schedule(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self.expiry.cancel(key)
 
+    def _absorb(self, snapshot: dict[str, Any], stored: dict[str, Any]) -> None:
+        super()._absorb(snapshot, stored)
+        if stored != snapshot:
+            self.expiry.rebuild(self)
 
-yamanote_line_announces = itertools.cycle(
-    [
+    async def _expire(self, key: str) -> None:
+        if key in self and self[key] <= time.time():
+            until = self[key]
+            del self[key]
+            self.history.end(int(key), "expire", time.time())
+            audit("expire", self.guild_id, int(key), until=until)
+
+
+# AUDIT_LOG_DIR (default data/audit, empty to disable) and AUDIT_LOG_*: see audit.py.
+audit_log = AuditLog.from_env()
+
+
+def audit(action: str, guild_id: int, user_id: int, **fields: Any) -> None:
+    if audit_log is not None:
+        audit_log.record(action, guild_id, user_id, **fields)
+
+
+ROLE_EDIT_RATE = float(os.environ.get("ROLE_EDIT_RATE", "5"))
+ROLE_EDIT_BURST = float(os.environ.get("ROLE_EDIT_BURST", "5"))
+ROLE_EDIT_CONCURRENCY = int(os.environ.get("ROLE_EDIT_CONCURRENCY", "4"))
+ENFORCE_WINDOW_SECONDS = float(os.environ.get("ENFORCE_WINDOW_SECONDS", "1"))
+
+
+class GuildState:
+    """State, enforcement queue and role-edit pacing of one moderated guild."""
+
+    def __init__(self, config: GuildConfig) -> None:
+        self.config = config
+        self.users = FileDict(*config.state_paths("users.json"))
+        self.history = HistoryDict(*config.state_paths("punishment-history.json"))
+        self.punishment = PunishmentDict(
+            *config.state_paths("punishment.json"), config.id, self.history
+        )
+        # "message:<source message ID>" and "sha256:<attachment digest>"
+        # -> archive post URL
+        self.eshiritori_index = FileDict(*config.state_paths("eshiritori.json"))
+        # Progress of /setup, so an interrupted run can be resumed.
+        self.setup_state = FileDict(*config.state_paths("setup.json"))
+        self.stores: list[FileDict] = [
+            self.users,
+            self.punishment,
+            self.history,
+            self.eshiritori_index,
+            self.setup_state,
+        ]
+        # Member edits share a per-guild rate limit; pace sweeps below it.
+        self.role_edit_limiter = TokenBucket(ROLE_EDIT_RATE, ROLE_EDIT_BURST)
+        self.enforcer: Coalescer[int] = Coalescer(
+            self._enforce, ENFORCE_WINDOW_SECONDS
+        )
+
+    async def _enforce(self, member_ids: set[int]) -> None:
+        await enforce_members(self, member_ids)
+
+
+# GUILDS_CONFIG: optional JSON file with per-guild settings (see guilds.py).
+guild_configs = load_guild_configs()
+COMMAND_GUILD_IDS = [c.id for c in guild_configs.values() if c.moderated]
+# Only guilds on this process's shards are loaded, swept and scheduled here.
+guild_states = {
+    c.id: GuildState(c)
+    for c in guild_configs.values()
+    if c.moderated and is_local(c.id)
+}
+SETUP_PROGRESS_INTERVAL = float(os.environ.get("SETUP_PROGRESS_INTERVAL", "5"))
+# Position in YAMANOTE_LINE_ANNOUNCES, so a restart resumes at the next station.
+announce_state = FileDict(os.path.join("data", "announce.json"), "announce.json")
+state_stores: list[FileDict] = [
+    *(s for g in guild_states.values() for s in g.stores),
+    announce_state,
+]
+metrics.Gauge(
+    "solid_funicular_users",
+    "Entries in users, all guilds.",
+    lambda: sum(len(g.users) for g in guild_states.values()),
+)
+metrics.Gauge(
+    "solid_funicular_punishments",
+    "Entries in punishment, all guilds.",
+    lambda: sum(len(g.punishment) for g in guild_states.values()),
+)
+metrics.Gauge(
+    "solid_funicular_outbound_pending", "Queued outbound sends.", lambda: len(outbound)
+)
+
+
+async def load_state() -> None:
+    await asyncio.gather(*(store.aload() for store in state_stores))
+
+
+async def become_leader() -> None:
+    # The previous leader may have written since we last loaded.
+    await load_state()
+    for store in state_stores:
+        store.read_only = False
+    # Also catch up on anything missed while disconnected as a standby.
+    for guild in bot.guilds:
+        privileged_roles.build(guild)
+    fallback_channels.clear()
+    if bot.is_ready():
+        start_leader_work()
+
+
+async def become_standby() -> None:
+    for store in state_stores:
+        store.read_only = True
+    check.cancel()
+    announce_station.cancel()
+    for state in guild_states.values():
+        state.punishment.expiry.stop()
+
+
+# BOT_LEASE_TTL: seconds; when set, replicas elect one leader to run the
+# background loops and write state, and the others stand by to take over.
+# Replicas running different shards elect leaders independently.
+LEASE_OBJECT = (
+    f"leader-{'-'.join(map(str, SHARD_IDS))}.json" if SHARD_IDS else "leader.json"
+)
+leader = Lease(
+    JsonState(os.path.join("data", LEASE_OBJECT), LEASE_OBJECT),
+    float(os.environ.get("BOT_LEASE_TTL", "0")),
+    become_leader,
+    become_standby,
+    os.environ.get("BOT_REPLICA_ID"),
+)
+if leader.enabled:
+    for store in state_stores:
+        store.read_only = True
+STANDBY_EVENTS = {
+    "connect",
+    "disconnect",
+    "ready",
+    "resumed",
+    "shard_connect",
+    "shard_disconnect",
+    "shard_ready",
+    "shard_resumed",
+    # These handlers only keep caches current (enforcement they trigger is
+    # skipped off the leader), so a takeover starts from accurate ones.
+    "guild_role_create",
+    "guild_role_update",
+    "guild_role_delete",
+    "guild_channel_create",
+    "guild_channel_delete",
+    "raw_member_remove",
+}
+
+
+@tasks.loop(seconds=float(os.environ.get("BOT_STANDBY_REFRESH_SECONDS", "30")))
+async def refresh_standby() -> None:
+    # Keep a standby's state warm so a takeover starts from recent data.
+    if not leader.is_leader:
+        await load_state()
+
+
+YAMANOTE_LINE_ANNOUNCES = [
+    Announcement.parse(text)
+    for text in [
         """この電車は、山手線内回り、上野・池袋方面行きです。
 
 次は、神田、神田、お出口は左側です。
@@ -337,7 +866,7 @@ The doors on the left side will open.
 
 Please change here the Shinkansen, the Chuo Line, the Tokaido Line,the Ueno-Tokyo Line, the Yokosuka Line, the Sobu Line rapid service the Keiyo Line and the Marunouchi Subway Line.""",
     ]
-)
+]
 
 
 # yamanote_line_stations = itertools.cycle(
@@ -376,25 +905,33 @@ Please change here the Shinkansen, the Chuo Line, the Tokaido Line,the Ueno-Toky
 # )
 
 
+# PRIVILEGED_PERMISSIONS: comma-separated permission names or an integer bitmask.
+privileged_roles = PrivilegedRoleIndex(
+    permission_mask(
+        os.environ.get("PRIVILEGED_PERMISSIONS") or DEFAULT_PRIVILEGED_PERMISSIONS
+    )
+)
+
+
 async def remove_manage_roles(member: discord.Member) -> None:
-    for role in member.roles:
-        p = role.permissions
-        if (
-            p.manage_channels
-            or p.manage_messages
-            or p.manage_roles
-            or p.ban_members
-            or p.kick_members
-            or p.administrator
-        ):
-            await member.remove_roles(role)
+    privileged = privileged_roles.for_guild(member.guild)
+    roles = [r for r in member.roles if not r.is_default()]
+    keep = [r for r in roles if r.id not in privileged]
+    if len(keep) == len(roles):
+        return
+    # One PATCH for the whole role set instead of a DELETE per role.
+    await member.edit(roles=keep)
+    removed = [r.id for r in roles if r.id in privileged]
+    audit("strip_roles", member.guild.id, member.id, roles=removed)
 
 
 @bot.event
 async def on_ready() -> None:
     print(f"Logged in as {bot.user}")
-    check.start()
-    announce_station.start()
+    for guild in bot.guilds:
+        privileged_roles.build(guild)
+    if leader.is_leader:
+        start_leader_work()
     # await bot.change_presence(
     #     activity=discord.Activity(
     #         type=discord.ActivityType.competing, name="がーとの脳内"
@@ -402,114 +939,369 @@ async def on_ready() -> None:
     # )
 
 
+def start_leader_work() -> None:
+    for state in guild_states.values():
+        state.punishment.expiry.start()
+    if not check.is_running():
+        check.start()
+    if not announce_station.is_running():
+        announce_station.start()
+
+
+# SCREENING_CONFIG: optional JSON file with per-channel rules (see screening.py).
+screening = ScreeningConfig.from_env()
+
+
 @bot.event
 async def on_message(message: discord.Message) -> None:
     if message.author.bot:
         return
-    pattern = re.compile(r"(.)\1{99,}")
-    if pattern.search(message.content):
+    if screening.for_channel(message.channel.id).screen(message.content):
         for _ in range(10):
-            await message.channel.send(
-                f"{message.author.mention} うるさい", delete_after=1.0
+            outbound.send(
+                message.channel,
+                f"{message.author.mention} うるさい",
+                delete_after=1.0,
+                priority=Priority.COSMETIC,
             )
-            await message.author.send(message.content)
+            outbound.send(message.author, message.content, priority=Priority.COSMETIC)
+
+
+async def alts_of(state: GuildState, main_id: int) -> list[int]:
+    users = state.users
+    if users.store.incremental:
+        # Indexed lookup on the main-account column.
+        await users.aflush()
+        return [int(k) for k in await users.store.afind(main_id)]
+    return [int(k) for k, v in users.items() if v == main_id]
+
+
+def is_punished(state: GuildState, member_id: int, now: float) -> bool:
+    if str(member_id) not in state.users:
+        return False
+    main_id = state.users[str(member_id)]
+    if main_id is None:
+        main_id = member_id
+    until = state.punishment.get(str(main_id))
+    # Expired entries are removed by punishment.expiry, right on time.
+    return until is not None and until > now
+
+
+async def enforce(member: discord.Member) -> None:
+    state = guild_states.get(member.guild.id)
+    if state is not None and is_punished(state, member.id, time.time()):
+        await remove_manage_roles(member)
+
+
+async def enforce_members(state: GuildState, member_ids: set[int]) -> None:
+    guild = bot.get_guild(state.config.id)
+    if guild is None or not leader.is_leader:
+        return
+    now = time.time()
+    # Decided from state alone, so only punished members are looked up.
+    punished = [i for i in member_ids if is_punished(state, i, now)]
+    members = await member_cache.resolve(guild, punished)
+    targets = [m for m in members if privileged_roles.privileged_roles(m)]
+    await run_pool(targets, enforce, ROLE_EDIT_CONCURRENCY, state.role_edit_limiter)
 
 
 @bot.event
 async def on_member_join(member: discord.Member) -> None:
-    await check()
+    if state := guild_states.get(member.guild.id):
+        if is_punished(state, member.id, time.time()):
+            member_cache.add(member)
+        state.enforcer.add(member.id)
+
+
+@bot.event
+async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent) -> None:
+    member_cache.discard(payload.guild_id, payload.user.id)
 
 
 @bot.event
 async def on_member_update(before: discord.Member, after: discord.Member) -> None:
-    await check()
+    state = guild_states.get(after.guild.id)
+    if state is None:
+        return
+    # Only a newly granted privileged role can matter to a punished member.
+    added = {r.id for r in after.roles} - {r.id for r in before.roles}
+    if added & privileged_roles.for_guild(after.guild):
+        state.enforcer.add(after.id)
+
+
+@bot.event
+async def on_guild_role_create(role: discord.Role) -> None:
+    privileged_roles.update(role)
 
 
 @bot.event
 async def on_guild_role_update(before: discord.Role, after: discord.Role) -> None:
-    await check()
+    state = guild_states.get(after.guild.id)
+    if privileged_roles.update(after) and state is not None:
+        state.enforcer.add(*(m.id for m in after.members))
+
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role) -> None:
+    privileged_roles.remove(role)
 
 
 @bot.slash_command(
     name="verify",
     default_member_permissions=admin_only,
-    guild_ids=[int(os.environ["GUILD_ID"])],
+    guild_ids=COMMAND_GUILD_IDS,
 )
 async def verify_user(
     ctx: discord.ApplicationContext,
     target: discord.Member,
     main: Optional[discord.Member] = None,
 ) -> None:
-    users[str(target.id)] = main.id if main is not None else None
-    if main is not None and str(main.id) in punishment:
+    state = guild_states[ctx.guild.id]
+    state.users[str(target.id)] = main.id if main is not None else None
+    audit(
+        "verify",
+        ctx.guild.id,
+        target.id,
+        actor=ctx.author.id,
+        main=main.id if main is not None else None,
+    )
+    if is_punished(state, target.id, time.time()):
+        # Tracked, so a privileged role granted later is stripped on update.
+        member_cache.add(target)
         await remove_manage_roles(target)
+    await state.users.aflush()
     await ctx.respond(f"{target.mention} is now verified!", ephemeral=True)
 
 
 @bot.slash_command(
     name="unverify",
     default_member_permissions=admin_only,
-    guild_ids=[int(os.environ["GUILD_ID"])],
+    guild_ids=COMMAND_GUILD_IDS,
 )
 async def unverify(ctx: discord.ApplicationContext, target: discord.Member) -> None:
-    del users[str(target.id)]
+    state = guild_states[ctx.guild.id]
+    main_id = state.users[str(target.id)]
+    del state.users[str(target.id)]
+    audit("unverify", ctx.guild.id, target.id, actor=ctx.author.id, main=main_id)
+    await state.users.aflush()
     await ctx.respond(f"{target.mention} is now unverified!", ephemeral=True)
 
 
 @bot.user_command(
     name="Punish",
     default_member_permissions=admin_only,
-    guild_ids=[int(os.environ["GUILD_ID"])],
+    guild_ids=COMMAND_GUILD_IDS,
 )
 async def punish(ctx: discord.ApplicationContext, member: discord.Member) -> None:
+    state = guild_states[ctx.guild.id]
     await remove_manage_roles(member)
-    punishment[str(member.id)] = time.time() + 24 * 60 * 60 * 30
+    now = time.time()
+    until = now + 24 * 60 * 60 * 30
+    state.punishment[str(member.id)] = until
+    # Punishing again replaces the running punishment; close its entry.
+    state.history.end(member.id, "extended", now)
+    state.history.record(member.id, now, until, ctx.author.id)
+    audit("punish", ctx.guild.id, member.id, actor=ctx.author.id, until=until)
+    member_cache.add(member)
+    state.enforcer.add(member.id, *await alts_of(state, member.id))
+    await state.punishment.aflush()
     await ctx.respond(f"{member.mention} is now punished!", ephemeral=True)
 
 
 @bot.user_command(
     name="Forgive",
     default_member_permissions=admin_only,
-    guild_ids=[int(os.environ["GUILD_ID"])],
+    guild_ids=COMMAND_GUILD_IDS,
 )
 async def forgive(ctx: discord.ApplicationContext, member: discord.Member) -> None:
-    del punishment[str(member.id)]
+    state = guild_states[ctx.guild.id]
+    until = state.punishment[str(member.id)]
+    del state.punishment[str(member.id)]
+    state.history.end(member.id, "forgive", time.time())
+    audit("forgive", ctx.guild.id, member.id, actor=ctx.author.id, until=until)
+    await state.punishment.aflush()
     await ctx.respond(f"{member.mention} is now forgiven!", ephemeral=True)
 
 
+EMBED_DESCRIPTION_LIMIT = 4096
+
+
+def embed_pages(
+    title: str, lines: list[str], per_page: int = 20
+) -> list[discord.Embed]:
+    """Split ``lines`` into embeds of at most ``per_page`` lines each, keeping
+    every description within Discord's size limit."""
+    embeds: list[discord.Embed] = []
+    page: list[str] = []
+    size = 0
+    for line in lines:
+        line = line[:EMBED_DESCRIPTION_LIMIT]
+        full = len(page) >= per_page or size + len(line) + 1 > EMBED_DESCRIPTION_LIMIT
+        if page and full:
+            embeds.append(discord.Embed(title=title, description="\n".join(page)))
+            page, size = [], 0
+        page.append(line)
+        size += len(line) + 1
+    if page:
+        embeds.append(discord.Embed(title=title, description="\n".join(page)))
+    for number, embed in enumerate(embeds, 1):
+        embed.set_footer(text=f"{number}/{len(embeds)} ({len(lines)} entries)")
+    return embeds
+
+
 @bot.slash_command(
     name="list-punishments",
-    guild_ids=[int(os.environ["GUILD_ID"])],
+    guild_ids=COMMAND_GUILD_IDS,
 )
 async def list_punishments(ctx: discord.ApplicationContext) -> None:
-    for k, v in punishment.items():
-        user = bot.get_user(int(k))
-        assert user
-        await ctx.respond(
-            f"{user.mention} is punished until <t:{int(v)}:F>", ephemeral=True
+    # Raw mentions render for any user ID, cached or not, without a fetch.
+    lines = [
+        f"<@{k}> is punished until <t:{int(v)}:F>"
+        for k, v in sorted(
+            guild_states[ctx.guild.id].punishment.items(), key=lambda kv: kv[1]
         )
+    ]
+    if not lines:
+        await ctx.respond("No one is punished.", ephemeral=True)
+        return
+    paginator = pages.Paginator(pages=embed_pages("Punishments", lines))
+    await paginator.respond(ctx.interaction, ephemeral=True)
+
+
+class HistoryPages(Sequence):
+    """Paginator pages of history entries, each rendered when it is shown.
+
+    ``keys`` is a snapshot of the matching keys, so every entry can be paged
+    to while only the pages actually viewed are built.
+    """
+
+    per_page = 20
+
+    def __init__(self, title: str, history: "HistoryDict", keys: list[str]) -> None:
+        self.title = title
+        self.history = history
+        self.keys = keys
+        self._rendered: dict[int, discord.Embed] = {}
+
+    def __len__(self) -> int:
+        return -(-len(self.keys) // self.per_page)
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        number = range(len(self))[index]
+        if number not in self._rendered:
+            keys = self.keys[number * self.per_page : (number + 1) * self.per_page]
+            # Entries are a few short lines each, far below the embed limit.
+            embed = discord.Embed(
+                title=self.title,
+                description="\n".join(history_line(self.history[k]) for k in keys),
+            )
+            embed.set_footer(
+                text=f"{number + 1}/{len(self)} ({len(self.keys)} entries)"
+            )
+            self._rendered[number] = embed
+        return self._rendered[number]
+
+
+def history_line(entry: dict[str, Any]) -> str:
+    start, until = int(entry["start"]), int(entry["until"])
+    line = f"<@{entry['user']}> <t:{start}:f> – <t:{until}:f>"
+    if "ended" in entry:
+        line += f" ({entry['reason']} <t:{int(entry['ended'])}:R>)"
+    return line
+
+
+def parse_day(value: str, end_of_day: bool = False) -> float:
+    """Epoch seconds of an ISO date or datetime; a bare date's end if asked."""
+    parsed = datetime.datetime.fromisoformat(value)
+    if end_of_day and len(value) == len("2024-01-01"):
+        parsed += datetime.timedelta(days=1, microseconds=-1)
+    return parsed.timestamp()
+
+
+@bot.slash_command(
+    name="punishment-history",
+    guild_ids=COMMAND_GUILD_IDS,
+)
+async def punishment_history(
+    ctx: discord.ApplicationContext,
+    user: Optional[discord.User] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> None:
+    history = guild_states[ctx.guild.id].history
+    try:
+        start = parse_day(since) if since else 0.0
+        end = parse_day(until, end_of_day=True) if until else time.time()
+    except ValueError:
+        await ctx.respond("Dates must look like 2024-01-31.", ephemeral=True)
+        return
+    if user is not None:
+        keys = [
+            k
+            for k in history.index.for_user(user.id)
+            if start <= history[k]["start"] <= end
+        ]
+        title = f"{user} was punished {len(keys)} times"
+        keys = keys[::-1]
+    else:
+        keys = list(history.index.between(start, end, newest_first=True))
+        title = f"{len(keys)} punishments"
+    if not keys:
+        await ctx.respond("No punishments found.", ephemeral=True)
+        return
+    paginator = pages.Paginator(pages=HistoryPages(title, history, keys))
+    await paginator.respond(ctx.interaction, ephemeral=True)
 
 
 @bot.message_command(
     name="絵しりとり保管",
-    guilds_ids=[int(os.environ["GUILD_ID"])],
+    guild_ids=COMMAND_GUILD_IDS,
 )
 async def store_eshiritori(
     ctx: discord.ApplicationContext, message: discord.Message
 ) -> None:
-    eshiritori_channel = bot.get_channel(int(os.environ["ESHIRITORI_CHANNEL_ID"]))
-    assert isinstance(eshiritori_channel, discord.TextChannel)
-    if eshiritori_channel is None:
+    # Downloads can take a while; acknowledge within the 3-second deadline.
+    await ctx.defer(ephemeral=True)
+    state = guild_states[ctx.guild.id]
+    eshiritori_index = state.eshiritori_index
+    eshiritori_channel = None
+    if state.config.eshiritori_channel_id is not None:
+        eshiritori_channel = bot.get_channel(state.config.eshiritori_channel_id)
+    if not isinstance(eshiritori_channel, discord.TextChannel):
         await ctx.respond("絵しりとり保管庫が見つかりませんでした。", ephemeral=True)
         return
-    files = []
-    for attachment in message.attachments:
-        file_bytes = BytesIO(await attachment.read())
-        file = discord.File(file_bytes, filename=attachment.filename)
-        files.append(file)
-    if len(files) == 0:
+    if len(message.attachments) == 0:
         await ctx.respond("画像が見つかりませんでした。", ephemeral=True)
         return
+    if archived_url := eshiritori_index.get(f"message:{message.id}"):
+        await ctx.respond(f"既に保管されています。{archived_url}", ephemeral=True)
+        return
+    upload_limit = eshiritori_channel.guild.filesize_limit
+    try:
+        downloads = await fetch_attachments(
+            message.attachments,
+            max_file_bytes=upload_limit,
+            max_total_bytes=int(
+                os.environ.get("ESHIRITORI_MAX_TOTAL_BYTES", upload_limit)
+            ),
+            concurrency=int(os.environ.get("ESHIRITORI_DOWNLOAD_CONCURRENCY", "3")),
+        )
+    except TransferTooLarge:
+        await ctx.respond("ファイルが大きすぎるため保管できませんでした。", ephemeral=True)
+        return
+    digests = [digest for digest, _ in downloads]
+    archived_urls = {eshiritori_index.get(f"sha256:{d}") for d in digests}
+    if None not in archived_urls:
+        # Every image is already in the archive (e.g. reposted elsewhere).
+        for _, file in downloads:
+            file.close()
+        eshiritori_index[f"message:{message.id}"] = next(iter(archived_urls))
+        await ctx.respond(
+            "既に保管されています。" + " ".join(sorted(archived_urls)), ephemeral=True
+        )
+        return
     embed = discord.Embed(
         description=message.content,
         timestamp=message.created_at,
@@ -522,17 +1314,23 @@ async def store_eshiritori(
         name="メッセージリンク",
         value=message.jump_url,
     )
-    await eshiritori_channel.send(
+    archived = await outbound.send(
+        eshiritori_channel,
         embed=embed,
-        files=files,
+        files=[file for _, file in downloads],
+        priority=Priority.NORMAL,
     )
+    eshiritori_index[f"message:{message.id}"] = archived.jump_url
+    for digest in digests:
+        if f"sha256:{digest}" not in eshiritori_index:
+            eshiritori_index[f"sha256:{digest}"] = archived.jump_url
     await ctx.respond("絵しりとり保管庫に保管しました。", ephemeral=True)
 
 
 # @bot.slash_command(
 #     name="pin-to-eshiritori",
 #     default_member_permissions=admin_only,
-#     guild_ids=[int(os.environ["GUILD_ID"])],
+#     guild_ids=COMMAND_GUILD_IDS,
 # )
 # async def pin_to_eshiritori(ctx: discord.ApplicationContext):
 #     pinned_messages = await ctx.channel.pins()
@@ -542,6 +1340,10 @@ async def store_eshiritori(
 
 
 class VotingView(View):
+    # Clicks are acknowledged at once; the visible tally is edited at most
+    # once per VOTE_EDIT_INTERVAL seconds.
+    edit_interval = float(os.environ.get("VOTE_EDIT_INTERVAL", "2"))
+
     def __init__(
         self,
         ctx: discord.ApplicationContext,
@@ -551,82 +1353,120 @@ class VotingView(View):
         super().__init__(timeout=timeout)
         self.ctx = ctx
         self.channel = channel
-        self.archive_category_id = int(os.environ["ARCHIVE_CATEGORY_ID"])
-        self.votes: dict[str, set[discord.User]] = {"👍": set(), "👎": set()}
+        self.state = guild_states[ctx.guild.id]
+        self.archive_category_id = self.state.config.archive_category_id
+        # Voter (main account) IDs per choice.
+        self.votes: dict[str, set[int]] = {"👍": set(), "👎": set()}
+        self.vote_message: Optional[discord.Message] = None
+        self.finished = False
+        self._last_edit = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
 
     async def on_timeout(self):
+        if self.finished:
+            return
         if len(self.votes["👍"]) > len(self.votes["👎"]):
             await self.archive_channel()
         else:
-            await self.ctx.edit(
-                content=f"反対 {len(self.votes['👎'])} 票のため投票が否決されました。",
-                view=None,
-            )
+            await self.reject()
 
     async def handle_vote_update(self, interaction: discord.Interaction):
         if len(self.votes["👍"]) >= 5:
             await self.archive_channel()
         elif len(self.votes["👎"]) >= 3:
-            await self.ctx.edit(
-                content=f"反対 {len(self.votes['👎'])} 票のため投票が否決されました。",
-                view=None,
-            )
+            await self.reject()
 
-    @discord.ui.button(label="賛成", style=discord.ButtonStyle.green, emoji="👍")
-    async def upvote_button(self, button: Button, interaction: discord.Interaction):
+    async def vote(self, interaction: discord.Interaction, choice: str) -> None:
         assert isinstance(interaction.user, discord.Member)
+        users = self.state.users
         if str(interaction.user.id) not in users:
             await interaction.response.send_message(
                 "あなたは認証されていません。", ephemeral=True
             )
             return
-        if users[str(interaction.user.id)] is not None:
-            user = self.ctx.guild.get_member(users[str(interaction.user.id)])
-        else:
-            user = interaction.user
-        self.votes["👍"].add(user)
-        self.votes["👎"].discard(user)
-        await interaction.response.edit_message(embed=self.get_vote_embed(), view=self)
+        if self.finished:
+            await interaction.response.defer()
+            return
+        voter = users[str(interaction.user.id)] or interaction.user.id
+        other = "👎" if choice == "👍" else "👍"
+        self.votes[choice].add(voter)
+        self.votes[other].discard(voter)
+        await interaction.response.defer()
+        self.vote_message = interaction.message
         await self.handle_vote_update(interaction)
+        if not self.finished:
+            self.schedule_refresh()
+
+    @discord.ui.button(label="賛成", style=discord.ButtonStyle.green, emoji="👍")
+    async def upvote_button(self, button: Button, interaction: discord.Interaction):
+        await self.vote(interaction, "👍")
 
     @discord.ui.button(label="反対", style=discord.ButtonStyle.red, emoji="👎")
     async def downvote_button(self, button: Button, interaction: discord.Interaction):
-        assert isinstance(interaction.user, discord.Member)
-        if str(interaction.user.id) not in users:
-            await interaction.response.send_message(
-                "あなたは認証されていません。", ephemeral=True
-            )
+        await self.vote(interaction, "👎")
+
+    def schedule_refresh(self) -> None:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+
+    async def _refresh(self) -> None:
+        delay = self._last_edit + self.edit_interval - time.monotonic()
+        await asyncio.sleep(max(0.0, delay))
+        if self.finished or self.vote_message is None:
             return
-        if users[str(interaction.user.id)] is not None:
-            user = self.ctx.guild.get_member(users[str(interaction.user.id)])
-        else:
-            user = interaction.user
-        self.votes["👎"].add(user)
-        self.votes["👍"].discard(user)
-        await interaction.response.edit_message(embed=self.get_vote_embed(), view=self)
-        await self.handle_vote_update(interaction)
+        self._last_edit = time.monotonic()
+        await self.vote_message.edit(embed=self.get_vote_embed(), view=self)
+
+    def finish(self) -> None:
+        self.finished = True
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        self.stop()
+
+    def voter_list(self, choice: str, limit: int = 1024) -> str:
+        """Voters as mentions, truncated with "+N more" to fit an embed field."""
+        voters = sorted(self.votes[choice])
+        lines: list[str] = []
+        size = 0
+        for index, voter_id in enumerate(voters):
+            member = self.ctx.guild.get_member(voter_id)
+            line = f"<@{voter_id}> ({member.name})" if member else f"<@{voter_id}>"
+            rest = len(voters) - index - 1
+            suffix = len(f"\n+{rest} more") if rest else 0
+            if size + len(line) + 1 + suffix > limit:
+                lines.append(f"+{len(voters) - index} more")
+                break
+            lines.append(line)
+            size += len(line) + 1
+        # Field values may not be empty.
+        return "\n".join(lines) or "-"
 
     def get_vote_embed(self) -> discord.Embed:
         embed = discord.Embed(
             title="アーカイブ投票",
             description=f"{self.channel.name} ({self.channel.mention}) をアーカイブしますか？",
         )
-        embed.add_field(
-            name="賛成",
-            value="\n".join(
-                f"{user.mention} ({user.name})" for user in self.votes["👍"]
-            ),
-        )
-        embed.add_field(
-            name="反対",
-            value="\n".join(
-                f"{user.mention} ({user.name})" for user in self.votes["👎"]
-            ),
-        )
+        embed.add_field(name="賛成", value=self.voter_list("👍"))
+        embed.add_field(name="反対", value=self.voter_list("👎"))
         return embed
 
+    async def reject(self):
+        self.finish()
+        await self.ctx.edit(
+            content=f"反対 {len(self.votes['👎'])} 票のため投票が否決されました。",
+            view=None,
+        )
+
     async def archive_channel(self):
+        self.finish()
         category = self.ctx.guild.get_channel(self.archive_category_id)
+        if category is None:
+            # Editing with category=None would move the channel to the top.
+            await self.ctx.edit(
+                content="アーカイブカテゴリが見つからないため移動できませんでした。",
+                view=None,
+            )
+            return
         await self.channel.edit(category=category, sync_permissions=True)
         await self.ctx.edit(
             content=f"賛成 {len(self.votes['👍'])} 票のため投票が可決されました。",
@@ -636,10 +1476,13 @@ class VotingView(View):
 
 @bot.slash_command(
     name="archive",
-    guild_ids=[int(os.environ["GUILD_ID"])],
+    guild_ids=COMMAND_GUILD_IDS,
     description="チャンネルを投票でアーカイブする",
 )
 async def archive_vote(ctx: discord.ApplicationContext, channel: discord.TextChannel):
+    if guild_states[ctx.guild.id].config.archive_category_id is None:
+        await ctx.respond("アーカイブカテゴリが設定されていません。", ephemeral=True)
+        return
     embed = discord.Embed(
         title="アーカイブ投票",
         description=f"{channel.name} ({channel.mention}) をアーカイブしますか？",
@@ -651,33 +1494,102 @@ async def archive_vote(ctx: discord.ApplicationContext, channel: discord.TextCha
 @bot.slash_command(
     name="setup",
     default_member_permissions=admin_only,
-    guild_ids=[int(os.environ["GUILD_ID"])],
+    guild_ids=COMMAND_GUILD_IDS,
 )
 async def setup(ctx: discord.ApplicationContext) -> None:
-    member_role = ctx.guild.get_role(int(os.environ["MEMBER_ROLE_ID"]))
-    for member in ctx.guild.members:
-        if str(member.id) not in users:
-            users[str(member.id)] = None
+    await ctx.defer(ephemeral=True)
+    guild = ctx.guild
+    state = guild_states[guild.id]
+    users, setup_state = state.users, state.setup_state
+    member_role = guild.get_role(state.config.member_role_id or 0)
+    if member_role is None:
+        await ctx.respond("No member role is configured.", ephemeral=True)
+        return
+    # Grants left over from an interrupted run are picked up again.
+    pending = set(setup_state.get("pending", []))
+    members = {m.id: m for m in await member_cache.all_members(guild)}
+    new_ids = [i for i in members if str(i) not in users]
+    pending.update(new_ids)
+    # Record the grants before verifying, so a crash in between loses nothing.
+    setup_state["pending"] = sorted(pending)
+    await setup_state.aflush()
+    for member_id in new_ids:
+        users[str(member_id)] = None
+    await users.aflush()
+    await ctx.respond(
+        f"Verified {len(new_ids)} members; granting roles to {len(pending)}.",
+        ephemeral=True,
+    )
+    if not pending:
+        return
+
+    progress = await outbound.send(
+        ctx.channel,
+        f"/setup: 0/{len(pending)} roles granted",
+        priority=Priority.MODERATION,
+    )
+    done: set[int] = set()
+
+    async def grant(member_id: int) -> None:
+        member = members.get(member_id)
+        if member is not None and member_role not in member.roles:
             await member.add_roles(member_role)
+        done.add(member_id)
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(SETUP_PROGRESS_INTERVAL)
+            setup_state["pending"] = sorted(pending - done)
+            await progress.edit(
+                content=f"/setup: {len(done)}/{len(pending)} roles granted"
+            )
+
+    reporter = asyncio.create_task(report())
+    try:
+        await run_pool(
+            sorted(pending), grant, ROLE_EDIT_CONCURRENCY, state.role_edit_limiter
+        )
+    finally:
+        reporter.cancel()
+        failed = pending - done
+        if failed:
+            setup_state["pending"] = sorted(failed)
+        elif "pending" in setup_state:
+            del setup_state["pending"]
+        await setup_state.aflush()
+    message = f"/setup: {len(done)}/{len(pending)} roles granted"
+    if failed:
+        message += f"; {len(failed)} failed, run /setup again to retry"
+    await progress.edit(content=message)
+
+
+SWEEP_SECONDS = metrics.Histogram(
+    "solid_funicular_sweep_seconds", "Duration of one guild's check() sweep."
+)
+SWEEP_MEMBERS = metrics.Counter(
+    "solid_funicular_sweep_members_scanned", "Members examined by check()."
+)
+
 
+async def sweep(state: GuildState) -> None:
+    with SWEEP_SECONDS.time():
+        state.punishment.expiry.rebuild(state.punishment)
+        member_ids = {int(k) for k in state.users}
+        SWEEP_MEMBERS.inc(amount=len(member_ids))
+        await enforce_members(state, member_ids)
 
-@tasks.loop(minutes=1)
+
+@tasks.loop(minutes=float(os.environ.get("CHECK_SWEEP_MINUTES", "30")))
 async def check() -> None:
-    guild = bot.get_guild(int(os.environ["GUILD_ID"]))
-    assert guild
-    for member in guild.members:
-        if str(member.id) not in users:
-            continue
-        if users[str(member.id)] is not None:
-            main = member.guild.get_member(users[str(member.id)])
-        else:
-            main = member
-        assert main
-        if str(main.id) in punishment:
-            if punishment[str(main.id)] > time.time():
-                await remove_manage_roles(member)
-            else:
-                del punishment[str(main.id)]
+    # Safety net for anything the event-driven enforcer missed (e.g. events
+    # dropped while disconnected); only verified members can be affected.
+    # Guilds are swept concurrently, each paced by its own role-edit limiter.
+    results = await asyncio.gather(
+        *(sweep(state) for state in guild_states.values()), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            traceback.print_exception(result)
 
 
 @tasks.loop(minutes=2)
@@ -686,34 +1598,85 @@ async def announce_station() -> None:
     now = datetime.datetime.now().time()
     if datetime.time(hour=0, minute=56) <= now <= datetime.time(hour=4, minute=25):
         return
-    guild = bot.get_guild(1181575958730391642)
+    configs = [
+        c
+        for c in guild_configs.values()
+        if c.announce_channel_id is not None and is_local(c.id)
+    ]
+    if not configs:
+        # Another shard's process announces and owns the cursor.
+        return
+    index = announce_state.get("index", 0) % len(YAMANOTE_LINE_ANNOUNCES)
+    announce = YAMANOTE_LINE_ANNOUNCES[index]
+    announce_state["index"] = (index + 1) % len(YAMANOTE_LINE_ANNOUNCES)
+    results = await asyncio.gather(
+        *(announce_in(config, announce) for config in configs),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            traceback.print_exception(result)
+
+
+# Text channels fetched when the announce channel is unavailable, per guild;
+# dropped when the guild's channels change.
+fallback_channels: dict[int, list[discord.TextChannel]] = {}
+
+
+async def announce_channel(
+    guild: discord.Guild, config: GuildConfig
+) -> Optional[discord.TextChannel]:
+    channel = guild.get_channel(config.announce_channel_id)
+    if isinstance(channel, discord.TextChannel):
+        return channel
+    if guild.id not in fallback_channels:
+        fetched = await guild.fetch_channels()
+        fallback_channels[guild.id] = [
+            c for c in fetched if isinstance(c, discord.TextChannel)
+        ]
+    channels = fallback_channels[guild.id]
+    return random.choice(channels) if channels else None
+
+
+@bot.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel) -> None:
+    fallback_channels.pop(channel.guild.id, None)
+
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel) -> None:
+    fallback_channels.pop(channel.guild.id, None)
+
+
+async def announce_in(config: GuildConfig, announce: Announcement) -> None:
+    guild = bot.get_guild(config.id)
     if guild is None:
         return
-    channel = guild.get_channel(1181589574993064007)
-    if not isinstance(channel, discord.TextChannel):
-        all_channels = filter(
-            lambda c: isinstance(c, discord.TextChannel), await guild.fetch_channels()
-        )
-        channels = list(all_channels)
-        if not channels:
-            return
-        channel = random.choice(channels)
-        if not isinstance(channel, discord.TextChannel):
-            return
+    channel = await announce_channel(guild, config)
+    if channel is None:
+        return
     if bot.user is None:
         return
     bot_member = guild.get_member(bot.user.id)
     if bot_member is None:
         return
-    announce = next(yamanote_line_announces)
-    if m := re.search(r"この電車は、山手線内回り、(.+?)方面行きです。", announce):
-        await bot_member.edit(nick=f"山手線内回り {m.group(1)}方面行き")
-    await channel.send("<@!600922778509770754>\n" + announce)
+    if announce.nick is not None and bot_member.nick != announce.nick:
+        await bot_member.edit(nick=announce.nick)
+    content = announce.text
+    if config.announce_mention:
+        content = f"{config.announce_mention}\n{announce.text}"
+    outbound.send(
+        channel,
+        content,
+        priority=Priority.COSMETIC,
+        # A station still waiting to be sent is superseded by the next one.
+        dedup_key=("announce", channel.id),
+        replace=True,
+    )
 
 
 @bot.message_command(
     name="ピン留め",
-    guilds_ids=[int(os.environ["GUILD_ID"])],
 )
 async def pin(ctx: discord.ApplicationContext, message: discord.Message) -> None:
     await message.pin()
@@ -722,7 +1685,6 @@ async def pin(ctx: discord.ApplicationContext, message: discord.Message) -> None
 
 @bot.message_command(
     name="ピン留め解除",
-    guilds_ids=[int(os.environ["GUILD_ID"])],
 )
 async def unpin(ctx: discord.ApplicationContext, message: discord.Message) -> None:
     await message.unpin()
@@ -731,7 +1693,15 @@ async def unpin(ctx: discord.ApplicationContext, message: discord.Message) -> No
 
 def main():
     """Main entry point for the bot."""
-    bot.run(os.environ["DISCORD_TOKEN"])
+    try:
+        bot.run(os.environ["DISCORD_TOKEN"])
+    finally:
+        # bot.run stops the loop on SIGINT/SIGTERM; write out anything pending.
+        for store in state_stores:
+            store.flush()
+        if audit_log is not None:
+            audit_log.close()
+        leader.release()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from typing import Iterable
+
+import discord
+
+# Discord accepts up to 100 user IDs per member request.
+QUERY_BATCH = 100
+
+
+class MemberCache:
+    """Member lookups for guilds that are or are not fully chunked.
+
+    In full mode py-cord caches every member and lookups only read that
+    cache. In lean mode (no chunking, no member caching by py-cord) just the
+    members the bot acts on are kept: a bounded LRU whose members are also
+    put in the guild's cache so py-cord keeps them updated from gateway
+    events, and is evicted from it again. Missing members are fetched in
+    batched gateway member requests.
+    """
+
+    def __init__(self, lean: bool, capacity: int) -> None:
+        self.lean = lean
+        self.capacity = capacity
+        self._lru: OrderedDict[tuple[int, int], discord.Member] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def add(self, member: discord.Member) -> None:
+        if not self.lean:
+            return
+        key = (member.guild.id, member.id)
+        self._lru[key] = member
+        self._lru.move_to_end(key)
+        member.guild._add_member(member)
+        while len(self._lru) > self.capacity:
+            _, evicted = self._lru.popitem(last=False)
+            # py-cord always keeps the bot's own member.
+            if evicted.id != evicted.guild._state.self_id:
+                evicted.guild._remove_member(evicted)
+
+    def discard(self, guild_id: int, member_id: int) -> None:
+        self._lru.pop((guild_id, member_id), None)
+
+    async def resolve(
+        self, guild: discord.Guild, member_ids: Iterable[int]
+    ) -> list[discord.Member]:
+        """The given guild members, skipping IDs that are not in the guild."""
+        found: list[discord.Member] = []
+        missing: list[int] = []
+        for member_id in member_ids:
+            member = guild.get_member(member_id)
+            if member is not None:
+                self.add(member)
+                found.append(member)
+            elif self.lean:
+                missing.append(member_id)
+        for start in range(0, len(missing), QUERY_BATCH):
+            batch = missing[start : start + QUERY_BATCH]
+            members = await guild.query_members(
+                user_ids=batch, limit=len(batch), cache=False
+            )
+            for member in members:
+                self.add(member)
+            found.extend(members)
+        return found
+
+    async def all_members(self, guild: discord.Guild) -> list[discord.Member]:
+        """Every member of ``guild``; a one-off full fetch in lean mode."""
+        if not self.lean:
+            return list(guild.members)
+        # Returns None if the guild is no longer available.
+        return await guild.chunk(cache=False) or []
@@ -0,0 +1,166 @@
+import asyncio
+import heapq
+import itertools
+import traceback
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+import discord
+
+from solid_funicular.batching import TokenBucket
+
+
+class Priority(IntEnum):
+    # Interaction responses go to the interaction webhook, not through here.
+    MODERATION = 0
+    NORMAL = 1
+    COSMETIC = 2
+
+
+@dataclass(eq=False)
+class _Job:
+    priority: Priority
+    seq: int
+    route: Hashable
+    send: Callable[[], Awaitable[Any]]
+    future: asyncio.Future
+    dedup_key: Optional[Hashable] = None
+    dropped: bool = field(default=False)
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundQueue:
+    """Central dispatcher for outbound Discord messages.
+
+    Jobs run in priority order through a few workers, each paced by a token
+    bucket for its route (e.g. one channel or DM). Identical pending jobs
+    that share a dedup key collapse into one, optionally taking the newest
+    payload. When ``max_pending`` jobs are
+    waiting, the least urgent one is dropped (its future is cancelled) to
+    make room, or the new job is if nothing pending is less urgent.
+    """
+
+    def __init__(
+        self,
+        max_pending: int = 500,
+        workers: int = 4,
+        rate: float = 1.0,
+        burst: float = 5.0,
+    ) -> None:
+        self.max_pending = max_pending
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.dropped = 0
+        self._heap: list[_Job] = []
+        self._live = 0
+        self._dedup: dict[Hashable, _Job] = {}
+        self._buckets: dict[Hashable, TokenBucket] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        return self._live
+
+    def submit(
+        self,
+        route: Hashable,
+        send: Callable[[], Awaitable[Any]],
+        priority: Priority = Priority.NORMAL,
+        dedup_key: Optional[Hashable] = None,
+        replace: bool = False,
+    ) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        if dedup_key is not None and dedup_key in self._dedup:
+            pending = self._dedup[dedup_key]
+            if replace:
+                # The newer payload takes the pending job's place in line.
+                pending.send = send
+            return pending.future
+        future = loop.create_future()
+        if self._live >= self.max_pending and not self._make_room(priority):
+            self.dropped += 1
+            future.cancel()
+            return future
+        job = _Job(priority, next(self._seq), route, send, future, dedup_key)
+        heapq.heappush(self._heap, job)
+        self._live += 1
+        if dedup_key is not None:
+            self._dedup[dedup_key] = job
+        self._start(loop)
+        self._wakeup.set()
+        return future
+
+    def send(
+        self,
+        target: discord.abc.Messageable,
+        *args: Any,
+        priority: Priority = Priority.NORMAL,
+        dedup_key: Optional[Hashable] = None,
+        replace: bool = False,
+        **kwargs: Any,
+    ) -> asyncio.Future:
+        """Queue ``target.send(*args, **kwargs)``, routed per channel or user."""
+        route = (type(target).__name__, getattr(target, "id", None))
+        return self.submit(
+            route, lambda: target.send(*args, **kwargs), priority, dedup_key, replace
+        )
+
+    def _make_room(self, priority: Priority) -> bool:
+        worst = max((j for j in self._heap if not j.dropped), default=None)
+        if worst is None or worst.priority <= priority:
+            return False
+        self._discard(worst)
+        worst.dropped = True
+        worst.future.cancel()
+        self.dropped += 1
+        return True
+
+    def _discard(self, job: _Job) -> None:
+        self._live -= 1
+        if job.dedup_key is not None and self._dedup.get(job.dedup_key) is job:
+            del self._dedup[job.dedup_key]
+
+    def _bucket(self, route: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(loop.create_task(self._worker()))
+
+    async def _worker(self) -> None:
+        while True:
+            while not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            job = heapq.heappop(self._heap)
+            if job.dropped:
+                continue
+            self._discard(job)
+            if job.future.cancelled():
+                continue
+            await self._bucket(job.route).acquire()
+            try:
+                result = await job.send()
+            except Exception as error:
+                if not job.future.cancelled():
+                    job.future.set_exception(error)
+                    # Fire-and-forget callers never look at the future.
+                    job.future.add_done_callback(_log_exception)
+                continue
+            if not job.future.cancelled():
+                job.future.set_result(result)
+
+
+def _log_exception(future: asyncio.Future) -> None:
+    error = future.exception()
+    if error is not None:
+        traceback.print_exception(error)
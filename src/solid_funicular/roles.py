@@ -0,0 +1,69 @@
+from typing import Iterable
+
+import discord
+
+DEFAULT_PRIVILEGED_PERMISSIONS = (
+    "manage_channels",
+    "manage_messages",
+    "manage_roles",
+    "ban_members",
+    "kick_members",
+    "administrator",
+)
+
+
+def permission_mask(spec: str | Iterable[str]) -> int:
+    """Turn a permission bitmask string or permission flag names into a bitmask."""
+    if isinstance(spec, str):
+        if spec.strip().isdigit():
+            return int(spec)
+        spec = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in spec if name not in discord.Permissions.VALID_FLAGS]
+    if unknown:
+        raise ValueError(f"Unknown permission flags: {', '.join(unknown)}")
+    return discord.Permissions(**{name: True for name in spec}).value
+
+
+class PrivilegedRoleIndex:
+    """Per-guild set of role IDs granting any permission in ``mask``.
+
+    Built once per guild and kept current from role create/update/delete
+    events, so checking a member is a set intersection on role IDs rather
+    than a permission read per role.
+    """
+
+    def __init__(self, mask: int) -> None:
+        self.mask = mask
+        self._guilds: dict[int, set[int]] = {}
+
+    def is_privileged(self, role: discord.Role) -> bool:
+        return not role.is_default() and bool(role.permissions.value & self.mask)
+
+    def build(self, guild: discord.Guild) -> set[int]:
+        ids = {role.id for role in guild.roles if self.is_privileged(role)}
+        self._guilds[guild.id] = ids
+        return ids
+
+    def for_guild(self, guild: discord.Guild) -> set[int]:
+        ids = self._guilds.get(guild.id)
+        if ids is None:
+            ids = self.build(guild)
+        return ids
+
+    def update(self, role: discord.Role) -> bool:
+        """Record ``role``'s current permissions; True if it just became privileged."""
+        ids = self.for_guild(role.guild)
+        if not self.is_privileged(role):
+            ids.discard(role.id)
+            return False
+        if role.id in ids:
+            return False
+        ids.add(role.id)
+        return True
+
+    def remove(self, role: discord.Role) -> None:
+        self.for_guild(role.guild).discard(role.id)
+
+    def privileged_roles(self, member: discord.Member) -> list[discord.Role]:
+        ids = self.for_guild(member.guild)
+        return [role for role in member.roles if role.id in ids]
@@ -0,0 +1,212 @@
+import json
+import os
+from typing import Any, Optional, Protocol
+
+
+class Detector(Protocol):
+    name: str
+
+    def __call__(self, content: str) -> bool: ...
+
+
+class RepeatedCharRun:
+    """Same character (other than a newline) ``min_run`` or more times in a row.
+
+    Equivalent to ``(.)\\1{min_run-1,}``. Any such run covers one of the
+    positions ``min_run - 1, 2 * min_run - 1, ...``, so only those are
+    probed, each with one bounded substring search.
+    """
+
+    name = "repeated_char_run"
+
+    def __init__(self, min_run: int) -> None:
+        self.min_run = min_run
+
+    def __call__(self, content: str) -> bool:
+        m = self.min_run
+        for j in range(m - 1, len(content), m):
+            ch = content[j]
+            if ch != "\n" and content.find(ch * m, max(0, j - m + 1), j + m) != -1:
+                return True
+        return False
+
+
+class RepeatedSubstring:
+    """A block of 2 to ``max_period`` characters repeated back to back until
+    it spans ``min_length`` characters (e.g. "abcabcabc...").
+
+    Such a span is periodic for at least ``min_length // 2`` characters
+    after one of the probes spaced that far apart, so each probe is one
+    short substring search plus a slice comparison per candidate period.
+    """
+
+    name = "repeated_substring"
+
+    def __init__(self, min_length: int, max_period: int = 16) -> None:
+        self.min_length = min_length
+        self.max_period = max_period
+
+    def __call__(self, content: str) -> bool:
+        n = len(content)
+        half = self.min_length // 2
+        if n < self.min_length or half < 2:
+            return False
+        max_period = min(self.max_period, half - 1)
+        key_len = min(8, half - max_period)
+        for j in range(0, n - half + 1, half):
+            # If content[j : j + half] has period p, its first few characters
+            # recur at j + p; ordinary text has no such recurrence nearby.
+            key = content[j : j + key_len]
+            end = j + max_period + key_len
+            pos = content.find(key, j + 2, end)
+            while pos != -1:
+                period = pos - j
+                if (
+                    content[j : j + half - period] == content[pos : j + half]
+                    and self._span(content, j, period) >= self.min_length
+                ):
+                    return True
+                pos = content.find(key, pos + 1, end)
+        return False
+
+    def _span(self, content: str, j: int, period: int) -> int:
+        """Length of the ``period``-periodic block around ``j``, capped."""
+        limit = self.min_length
+        right = _common_prefix(content, j + period, j, limit)
+        left = _common_suffix(content, j + period, j, limit)
+        return left + period + right
+
+
+def _common_prefix(content: str, a: int, b: int, limit: int) -> int:
+    """Length (up to ``limit``) of the common prefix of content[a:] and content[b:]."""
+    limit = min(limit, len(content) - max(a, b))
+    lo, step = 0, 16
+    # Gallop with C-level slice comparisons, then binary search the mismatch.
+    while lo < limit:
+        hi = min(limit, lo + step)
+        if content[a + lo : a + hi] != content[b + lo : b + hi]:
+            break
+        lo, step = hi, step * 2
+    else:
+        return limit
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if content[a + lo : a + mid] == content[b + lo : b + mid]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def _common_suffix(content: str, a: int, b: int, limit: int) -> int:
+    """Length (up to ``limit``) of the common suffix of content[:a] and content[:b]."""
+    limit = min(limit, a, b)
+    lo, step = 0, 16
+    while lo < limit:
+        hi = min(limit, lo + step)
+        if content[a - hi : a - lo] != content[b - hi : b - lo]:
+            break
+        lo, step = hi, step * 2
+    else:
+        return limit
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if content[a - mid : a - lo] == content[b - mid : b - lo]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+class MentionFlood:
+    """More than ``max_mentions`` user or role mentions."""
+
+    name = "mention_flood"
+
+    def __init__(self, max_mentions: int) -> None:
+        self.max_mentions = max_mentions
+
+    def __call__(self, content: str) -> bool:
+        return content.count("<@") > self.max_mentions
+
+
+class OversizedContent:
+    name = "max_length"
+
+    def __init__(self, max_length: int) -> None:
+        self.max_length = max_length
+
+    def __call__(self, content: str) -> bool:
+        return len(content) > self.max_length
+
+
+def _build(name: str, option: Any) -> Detector:
+    if name == RepeatedCharRun.name:
+        return RepeatedCharRun(int(option))
+    if name == RepeatedSubstring.name:
+        if isinstance(option, dict):
+            return RepeatedSubstring(**option)
+        return RepeatedSubstring(int(option))
+    if name == MentionFlood.name:
+        return MentionFlood(int(option))
+    if name == OversizedContent.name:
+        return OversizedContent(int(option))
+    raise ValueError(f"Unknown screening rule: {name}")
+
+
+class Screener:
+    def __init__(self, detectors: list[Detector]) -> None:
+        # Cheapest checks first so the common case exits early.
+        order = [OversizedContent.name, MentionFlood.name, RepeatedCharRun.name]
+        self.detectors = sorted(
+            detectors,
+            key=lambda d: order.index(d.name) if d.name in order else len(order),
+        )
+
+    @classmethod
+    def from_rules(cls, rules: dict[str, Any]) -> "Screener":
+        return cls([_build(k, v) for k, v in rules.items() if v is not None])
+
+    def screen(self, content: str) -> Optional[str]:
+        """Return the name of the first rule ``content`` trips, if any."""
+        for detector in self.detectors:
+            if detector(content):
+                return detector.name
+        return None
+
+
+DEFAULT_RULES: dict[str, Any] = {RepeatedCharRun.name: 100}
+
+
+class ScreeningConfig:
+    """Rules per channel: ``{"default": {...}, "channels": {"<id>": {...}}}``.
+
+    Channel rules are layered over the defaults; a rule set to null is
+    disabled for that channel. Screeners are built once per channel.
+    """
+
+    def __init__(self, config: Optional[dict[str, Any]] = None) -> None:
+        config = config or {}
+        self.default = {**DEFAULT_RULES, **config.get("default", {})}
+        self.channels: dict[str, dict[str, Any]] = config.get("channels", {})
+        self._screeners: dict[int, Screener] = {}
+        self._default_screener = Screener.from_rules(self.default)
+
+    @classmethod
+    def from_env(cls) -> "ScreeningConfig":
+        path = os.environ.get("SCREENING_CONFIG")
+        if not path:
+            return cls()
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def for_channel(self, channel_id: int) -> Screener:
+        screener = self._screeners.get(channel_id)
+        if screener is None:
+            rules = self.channels.get(str(channel_id))
+            if rules is None:
+                screener = self._default_screener
+            else:
+                screener = Screener.from_rules({**self.default, **rules})
+            self._screeners[channel_id] = screener
+        return screener
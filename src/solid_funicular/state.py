@@ -1,9 +1,127 @@
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import itertools
 import json
 import os
-from typing import Any
+import random
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
 
-import oci
-from oci.exceptions import ServiceError
+from solid_funicular.metrics import Counter, Histogram
+
+T = TypeVar("T")
+
+IO_WORKERS = int(os.environ.get("BOT_STATE_IO_WORKERS", "4"))
+IO_TIMEOUT = float(os.environ.get("BOT_STATE_IO_TIMEOUT", "60"))
+REQUEST_TIMEOUT = float(os.environ.get("BOT_STATE_REQUEST_TIMEOUT", "10"))
+MAX_INFLIGHT_WRITES = int(os.environ.get("BOT_STATE_MAX_INFLIGHT_WRITES", "2"))
+RETRY_ATTEMPTS = int(os.environ.get("BOT_STATE_RETRY_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.environ.get("BOT_STATE_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("BOT_STATE_RETRY_MAX_DELAY", "20"))
+CONFLICT_ATTEMPTS = int(os.environ.get("BOT_STATE_CONFLICT_ATTEMPTS", "5"))
+CONFLICT_BASE_DELAY = float(os.environ.get("BOT_STATE_CONFLICT_BASE_DELAY", "0.1"))
+CONFLICT_MAX_DELAY = float(os.environ.get("BOT_STATE_CONFLICT_MAX_DELAY", "5"))
+
+_MISSING = object()
+
+SQLITE_PATH = os.environ.get("BOT_STATE_SQLITE_PATH", "data/state.sqlite3")
+# Point the OCI backend at solid_funicular.fake_object_storage instead of a
+# tenancy: "memory" or a directory (see FakeObjectStorage.from_env for knobs).
+OCI_FAKE = os.environ.get("BOT_STATE_OCI_FAKE")
+
+STATE_IO_SECONDS = Histogram(
+    "solid_funicular_state_io_seconds",
+    "Time spent loading or saving a state object.",
+    ("backend", "operation"),
+)
+STATE_IO_BYTES = Counter(
+    "solid_funicular_state_io_bytes",
+    "Serialized state bytes read or written.",
+    ("backend", "operation"),
+)
+STATE_SKIPPED_WRITES = Counter(
+    "solid_funicular_state_skipped_writes",
+    "Saves skipped because the serialized state was unchanged.",
+    ("backend",),
+)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_write_slots = asyncio.Semaphore(MAX_INFLIGHT_WRITES)
+
+# One row per key of every state object. ``num`` mirrors numeric values (the
+# main account ID in users, the expiry in punishment) so both are indexed.
+_SQLITE_SCHEMA = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+CREATE TABLE IF NOT EXISTS state (
+    object TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    num NUMERIC,
+    PRIMARY KEY (object, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS state_num ON state (object, num);
+CREATE TABLE IF NOT EXISTS imported (
+    object TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    at REAL NOT NULL
+);
+"""
+_sqlite_connections: dict[str, tuple[sqlite3.Connection, threading.Lock]] = {}
+_sqlite_connections_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=IO_WORKERS, thread_name_prefix="state-io"
+        )
+    return _executor
+
+
+def _sqlite_connection(path: str) -> tuple[sqlite3.Connection, threading.Lock]:
+    with _sqlite_connections_lock:
+        if path not in _sqlite_connections:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            connection = sqlite3.connect(path, check_same_thread=False)
+            connection.executescript(_SQLITE_SCHEMA)
+            _sqlite_connections[path] = (connection, threading.Lock())
+        return _sqlite_connections[path]
+
+
+def _sqlite_num(value: Any) -> Optional[int | float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def with_retry(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Call ``fn``, retrying throttled and 5xx OCI errors with full-jitter backoff.
+
+    Errors are matched by their ``status`` so the fake's errors count too.
+    """
+    for attempt in itertools.count():
+        try:
+            return fn(*args, **kwargs)
+        except Exception as error:
+            if not _is_retryable(error) or attempt + 1 >= RETRY_ATTEMPTS:
+                raise
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)
+            time.sleep(random.uniform(0, delay))
+    raise AssertionError("unreachable")
 
 
 class JsonState:
@@ -15,6 +133,22 @@ class JsonState:
         self.namespace = os.environ.get("BOT_STATE_NAMESPACE")
         self.prefix = os.environ.get("BOT_STATE_PREFIX", "").strip("/")
         self._client = None
+        # Writes to one object are serialized, and a snapshot older than the
+        # last one written is dropped, so out-of-order executor jobs and
+        # abandoned (timed out) writes can never roll the object back.
+        self._io_lock = threading.RLock()
+        self._seq = itertools.count(1)
+        self._saved_seq = 0
+        # What we last read or wrote, for skipping no-op writes, conditional
+        # PUTs and merging on conflict.
+        self._digest: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self._base: dict[str, Any] = {}
+
+    @property
+    def incremental(self) -> bool:
+        """Whether the backend can store changed keys without rewriting everything."""
+        return self.backend == "sqlite"
 
     @property
     def key(self) -> str:
@@ -24,8 +158,22 @@ class JsonState:
 
     @property
     def client(self):
+        if self._client is None and OCI_FAKE:
+            from solid_funicular.fake_object_storage import shared_from_env
+
+            self._client = shared_from_env()
         if self._client is None:
-            self._client = oci.object_storage.ObjectStorageClient(self._oci_config())
+            # The OCI SDK is large and slow to import; it is only loaded once
+            # the OCI backend is actually used.
+            import oci
+
+            # with_retry is the only retry layer; the SDK's default strategy
+            # would retry each call for minutes, past IO_TIMEOUT.
+            self._client = oci.object_storage.ObjectStorageClient(
+                self._oci_config(),
+                timeout=REQUEST_TIMEOUT,
+                retry_strategy=oci.retry.NoneRetryStrategy(),
+            )
         return self._client
 
     def _oci_config(self) -> dict[str, str]:
@@ -43,49 +191,414 @@ class JsonState:
                     else {}
                 ),
             }
+        import oci
+
         return oci.config.from_file()
 
+    @property
+    def _service_error(self) -> type[Exception]:
+        from solid_funicular.fake_object_storage import (
+            FakeObjectStorage,
+            FakeServiceError,
+        )
+
+        if isinstance(self.client, FakeObjectStorage):
+            return FakeServiceError
+        from oci.exceptions import ServiceError
+
+        return ServiceError
+
+    async def aload(self) -> dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(_get_executor(), self.load), IO_TIMEOUT
+        )
+
+    async def asave(self, data: dict[str, Any]) -> dict[str, Any]:
+        # Snapshot on the loop thread; the caller keeps mutating ``data``.
+        snapshot = dict(data)
+        seq = next(self._seq)
+        loop = asyncio.get_running_loop()
+        async with _write_slots:
+            return await asyncio.wait_for(
+                loop.run_in_executor(_get_executor(), self._save, snapshot, seq),
+                IO_TIMEOUT,
+            )
+
+    async def asave_changes(
+        self, updates: dict[str, Any], deleted: Iterable[str]
+    ) -> None:
+        seq = next(self._seq)
+        loop = asyncio.get_running_loop()
+        async with _write_slots:
+            await asyncio.wait_for(
+                loop.run_in_executor(
+                    _get_executor(),
+                    self._save_changes,
+                    dict(updates),
+                    set(deleted),
+                    seq,
+                ),
+                IO_TIMEOUT,
+            )
+
     def load(self) -> dict[str, Any]:
-        if self.backend != "oci":
-            return self._load_local()
+        with self._io_lock, STATE_IO_SECONDS.time(self.backend, "load"):
+            if self.backend == "sqlite":
+                return self._load_sqlite()
+            if self.backend != "oci":
+                return self._load_local()
+            self._require_bucket()
+            return self._load_oci()
+
+    def save(self, data: dict[str, Any]) -> dict[str, Any]:
+        """Persist ``data`` and return what was actually stored.
+
+        The result differs from ``data`` only when another writer changed the
+        object concurrently and their changes were merged in.
+        """
+        return self._save(data, next(self._seq))
+
+    def save_changes(self, updates: dict[str, Any], deleted: Iterable[str]) -> None:
+        """Store only the given keys; requires an ``incremental`` backend."""
+        self._save_changes(updates, set(deleted), next(self._seq))
+
+    def _save(self, data: dict[str, Any], seq: int) -> dict[str, Any]:
+        with self._io_lock, STATE_IO_SECONDS.time(self.backend, "save"):
+            if seq < self._saved_seq:
+                return data
+            if self.backend == "sqlite":
+                base = self._base
+                updates = {k: v for k, v in data.items() if base.get(k, _MISSING) != v}
+                self._write_sqlite(updates, base.keys() - data.keys())
+                self._saved_seq = seq
+                return data
+            body = json.dumps(data).encode("utf-8")
+            if hashlib.sha256(body).digest() == self._digest:
+                STATE_SKIPPED_WRITES.inc(self.backend)
+                self._saved_seq = seq
+                return data
+            if self.backend != "oci":
+                self._save_local(body, data)
+            else:
+                self._require_bucket()
+                data = self._save_oci(body, data)
+            self._saved_seq = seq
+            return data
+
+    def _require_bucket(self) -> None:
         if not self.bucket or not self.namespace:
             raise RuntimeError(
                 "BOT_STATE_BUCKET and BOT_STATE_NAMESPACE are required when BOT_STATE_BACKEND=oci"
             )
+
+    def _remember(self, body: bytes, data: dict[str, Any], etag: Optional[str]) -> None:
+        self._digest = hashlib.sha256(body).digest()
+        self._base = dict(data)
+        self._etag = etag
+
+    def _load_oci(self) -> dict[str, Any]:
         try:
-            response = self.client.get_object(self.namespace, self.bucket, self.key)
-        except ServiceError as error:
+            response = with_retry(
+                self.client.get_object, self.namespace, self.bucket, self.key
+            )
+        except self._service_error as error:
             if error.status != 404:
                 raise
-            data: dict[str, Any] = {}
-            self.save(data)
+            # Nothing stored yet; the first save creates it with if-none-match.
+            self._digest = None
+            self._base = {}
+            self._etag = None
+            return {}
+        body = response.data.content
+        STATE_IO_BYTES.inc(self.backend, "load", amount=len(body))
+        data = json.loads(body.decode("utf-8"))
+        self._remember(body, data, response.headers.get("etag"))
+        return data
+
+    def _save_oci(self, body: bytes, data: dict[str, Any]) -> dict[str, Any]:
+        # The caller's data derives from what we last remembered. If a conflict
+        # re-read replaces that and the write then fails, the next save would
+        # pass if_match against a version the caller never merged and silently
+        # drop the other writer's changes, so the old base is put back.
+        remembered = (self._digest, self._base, self._etag)
+        try:
+            return self._put_oci(body, data)
+        except BaseException:
+            self._digest, self._base, self._etag = remembered
+            raise
+
+    def _put_oci(self, body: bytes, data: dict[str, Any]) -> dict[str, Any]:
+        for attempt in range(CONFLICT_ATTEMPTS):
+            if attempt:
+                # Writers that collided back off by different amounts, so
+                # they don't collide again on the next round.
+                delay = min(CONFLICT_MAX_DELAY, CONFLICT_BASE_DELAY * 2**attempt)
+                time.sleep(random.uniform(0, delay))
+            condition = (
+                {"if_match": self._etag} if self._etag else {"if_none_match": "*"}
+            )
+            try:
+                response = with_retry(
+                    self.client.put_object,
+                    self.namespace,
+                    self.bucket,
+                    self.key,
+                    body,
+                    content_type="application/json",
+                    **condition,
+                )
+            except self._service_error as error:
+                if error.status != 412:
+                    raise
+                # Someone else wrote the object since we last saw it: re-read
+                # and replay our changes on top of theirs.
+                base = self._base
+                theirs = self._load_oci()
+                data = merge(base, data, theirs)
+                body = json.dumps(data).encode("utf-8")
+                if hashlib.sha256(body).digest() == self._digest:
+                    return data
+                continue
+            STATE_IO_BYTES.inc(self.backend, "save", amount=len(body))
+            self._remember(body, data, response.headers.get("etag"))
             return data
-        return json.loads(response.data.content.decode("utf-8"))
+        raise RuntimeError(f"Gave up writing {self.key} after repeated conflicts")
 
-    def save(self, data: dict[str, Any]) -> None:
-        if self.backend != "oci":
-            self._save_local(data)
-            return
-        if not self.bucket or not self.namespace:
-            raise RuntimeError(
-                "BOT_STATE_BUCKET and BOT_STATE_NAMESPACE are required when BOT_STATE_BACKEND=oci"
+    def _save_changes(
+        self, updates: dict[str, Any], deleted: set[str], seq: int
+    ) -> None:
+        if not self.incremental:
+            raise RuntimeError(f"{self.backend} backend cannot store partial changes")
+        with self._io_lock, STATE_IO_SECONDS.time(self.backend, "save"):
+            # Callers fold the keys of a failed or abandoned batch into the
+            # next one, so a newer batch covers every key of an older one.
+            if seq < self._saved_seq:
+                return
+            self._write_sqlite(updates, deleted)
+            self._saved_seq = seq
+
+    def _load_sqlite(self) -> dict[str, Any]:
+        connection, lock = _sqlite_connection(SQLITE_PATH)
+        with lock:
+            rows = connection.execute(
+                "SELECT key, value FROM state WHERE object = ?", (self.object_name,)
+            ).fetchall()
+            imported = connection.execute(
+                "SELECT 1 FROM imported WHERE object = ?", (self.object_name,)
+            ).fetchone()
+            if rows and not imported:
+                # Databases from before the marker existed were already used.
+                with connection:
+                    connection.execute(
+                        "INSERT INTO imported (object, source, at) VALUES (?, ?, ?)",
+                        (self.object_name, "", time.time()),
+                    )
+                imported = True
+        # Only the first load migrates the JSON file; after that an empty
+        # object is just empty (e.g. every punishment forgiven), and the file
+        # is stale.
+        if not rows and not imported and os.path.exists(self.local_path):
+            count = self.import_json()
+            print(f"Imported {count} keys from {self.local_path} into {SQLITE_PATH}")
+            return dict(self._base)
+        STATE_IO_BYTES.inc(
+            self.backend, "load", amount=sum(len(value) for _, value in rows)
+        )
+        data = {key: json.loads(value) for key, value in rows}
+        self._base = dict(data)
+        return data
+
+    def _write_sqlite(self, updates: dict[str, Any], deleted: Iterable[str]) -> None:
+        rows = [
+            (self.object_name, k, json.dumps(v), _sqlite_num(v))
+            for k, v in updates.items()
+        ]
+        connection, lock = _sqlite_connection(SQLITE_PATH)
+        with lock, connection:
+            connection.executemany(
+                "INSERT INTO state (object, key, value, num) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (object, key) DO UPDATE "
+                "SET value = excluded.value, num = excluded.num",
+                rows,
             )
-        self.client.put_object(
-            self.namespace,
-            self.bucket,
-            self.key,
-            json.dumps(data).encode("utf-8"),
-            content_type="application/json",
+            connection.executemany(
+                "DELETE FROM state WHERE object = ? AND key = ?",
+                [(self.object_name, k) for k in deleted],
+            )
+        STATE_IO_BYTES.inc(
+            self.backend, "save", amount=sum(len(row[2]) for row in rows)
         )
+        self._base.update(updates)
+        for key in deleted:
+            self._base.pop(key, None)
+
+    def import_json(self, path: Optional[str] = None) -> int:
+        """Replace this object's SQLite rows with the contents of a JSON file."""
+        path = path or self.local_path
+        with open(path, "r") as f:
+            data = json.load(f)
+        connection, lock = _sqlite_connection(SQLITE_PATH)
+        with self._io_lock:
+            with lock, connection:
+                connection.execute(
+                    "DELETE FROM state WHERE object = ?", (self.object_name,)
+                )
+            self._base = {}
+            self._write_sqlite(data, ())
+            # Recorded after the rows, so a crash in between imports again.
+            with lock, connection:
+                connection.execute(
+                    "INSERT INTO imported (object, source, at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (object) DO UPDATE "
+                    "SET source = excluded.source, at = excluded.at",
+                    (self.object_name, path, time.time()),
+                )
+        return len(data)
+
+    async def afind(self, value: int | float) -> list[str]:
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(_get_executor(), self.find, value), IO_TIMEOUT
+        )
+
+    def find(self, value: int | float) -> list[str]:
+        """Keys whose value equals ``value``, via the index (SQLite only)."""
+        connection, lock = _sqlite_connection(SQLITE_PATH)
+        with lock:
+            rows = connection.execute(
+                "SELECT key FROM state WHERE object = ? AND num = ?",
+                (self.object_name, value),
+            ).fetchall()
+        return [key for (key,) in rows]
+
+    def read_versioned(self) -> tuple[dict[str, Any], Optional[str]]:
+        """The stored object and an opaque version for ``write_if``.
+
+        A missing object reads as ``({}, None)``. Unlike ``load`` this does not
+        touch what the regular save path remembers.
+        """
+        if self.backend == "oci":
+            self._require_bucket()
+            try:
+                response = with_retry(
+                    self.client.get_object, self.namespace, self.bucket, self.key
+                )
+            except self._service_error as error:
+                if error.status != 404:
+                    raise
+                return {}, None
+            body = response.data.content
+            return json.loads(body.decode("utf-8")), response.headers.get("etag")
+        with self._file_lock():
+            return self._read_local_versioned()
+
+    def write_if(self, data: dict[str, Any], version: Optional[str]) -> bool:
+        """Store ``data`` only if the object is still at ``version`` (None: absent).
+
+        Returns False, writing nothing, when someone else changed it first.
+        """
+        body = json.dumps(data).encode("utf-8")
+        if self.backend == "oci":
+            self._require_bucket()
+            condition = {"if_match": version} if version else {"if_none_match": "*"}
+            try:
+                with_retry(
+                    self.client.put_object,
+                    self.namespace,
+                    self.bucket,
+                    self.key,
+                    body,
+                    content_type="application/json",
+                    **condition,
+                )
+            except self._service_error as error:
+                if error.status != 412:
+                    raise
+                return False
+            return True
+        with self._file_lock():
+            if self._read_local_versioned()[1] != version:
+                return False
+            self._save_local(body, data)
+            return True
+
+    @contextlib.contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        # Serializes compare-and-swap between processes sharing the directory.
+        os.makedirs(os.path.dirname(self.local_path) or ".", exist_ok=True)
+        with open(f"{self.local_path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_local_versioned(self) -> tuple[dict[str, Any], Optional[str]]:
+        try:
+            with open(self.local_path, "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return {}, None
+        return json.loads(body.decode("utf-8")), hashlib.sha256(body).hexdigest()
 
     def _load_local(self) -> dict[str, Any]:
         if not os.path.exists(self.local_path):
-            self._save_local({})
+            self._save_local(b"{}", {})
             return {}
-        with open(self.local_path, "r") as f:
-            return json.load(f)
+        with open(self.local_path, "rb") as f:
+            body = f.read()
+        STATE_IO_BYTES.inc(self.backend, "load", amount=len(body))
+        data = json.loads(body.decode("utf-8"))
+        self._remember(body, data, None)
+        return data
 
-    def _save_local(self, data: dict[str, Any]) -> None:
+    def _save_local(self, body: bytes, data: dict[str, Any]) -> None:
         os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
-        with open(self.local_path, "w") as f:
-            json.dump(data, f)
+        # Write a sibling file and rename it over, so a crash mid-write never
+        # leaves a truncated state file behind.
+        tmp_path = f"{self.local_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.local_path)
+        STATE_IO_BYTES.inc(self.backend, "save", amount=len(body))
+        self._remember(body, data, None)
+
+
+def merge(
+    base: dict[str, Any], ours: dict[str, Any], theirs: dict[str, Any]
+) -> dict[str, Any]:
+    """Three-way merge keyed on top-level keys; our changes win on conflict."""
+    merged = dict(theirs)
+    for key in base.keys() | ours.keys():
+        mine = ours.get(key, _MISSING)
+        if mine == base.get(key, _MISSING):
+            continue
+        if mine is _MISSING:
+            merged.pop(key, None)
+        else:
+            merged[key] = mine
+    return merged
+
+
+def main(argv: list[str]) -> None:
+    """``python -m solid_funicular.state import-json [path.json:object ...]``
+
+    One-shot import of the JSON state files into the SQLite backend.
+    """
+    if not argv or argv[0] != "import-json":
+        raise SystemExit(main.__doc__)
+    specs = argv[1:] or [
+        "data/users.json:users.json",
+        "data/punishment.json:punishment.json",
+    ]
+    for spec in specs:
+        path, _, object_name = spec.partition(":")
+        count = JsonState(path, object_name or os.path.basename(path)).import_json()
+        print(f"Imported {count} keys from {path} into {SQLITE_PATH}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+import tempfile
+from typing import Sequence
+
+import aiohttp
+import discord
+
+CHUNK_SIZE = 64 * 1024
+
+
+class TransferTooLarge(Exception):
+    pass
+
+
+async def fetch_attachments(
+    attachments: Sequence[discord.Attachment],
+    *,
+    max_file_bytes: int,
+    max_total_bytes: int,
+    concurrency: int = 3,
+    spool_bytes: int = 8 * 1024 * 1024,
+) -> list[tuple[str, discord.File]]:
+    """Download attachments concurrently into re-uploadable files.
+
+    Each download is streamed into a SpooledTemporaryFile, which stays in
+    memory below ``spool_bytes`` and spills to disk above it. Size caps are
+    checked against the advertised sizes before anything is transferred and
+    again while streaming, the total across all downloads; the first failure
+    cancels the other downloads. Returns ``(sha256 hex digest, file)`` pairs in
+    attachment order.
+    """
+    too_big = [a.filename for a in attachments if a.size > max_file_bytes]
+    if too_big:
+        raise TransferTooLarge(", ".join(too_big))
+    if sum(a.size for a in attachments) > max_total_bytes:
+        raise TransferTooLarge("total")
+
+    slots = asyncio.Semaphore(concurrency)
+    total = 0
+
+    async def fetch(session: aiohttp.ClientSession, attachment: discord.Attachment):
+        nonlocal total
+        async with slots:
+            fp = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+            digest = hashlib.sha256()
+            try:
+                written = 0
+                async with session.get(attachment.url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        written += len(chunk)
+                        total += len(chunk)
+                        if written > max_file_bytes:
+                            raise TransferTooLarge(attachment.filename)
+                        if total > max_total_bytes:
+                            raise TransferTooLarge("total")
+                        digest.update(chunk)
+                        fp.write(chunk)
+            except BaseException:
+                fp.close()
+                raise
+            fp.seek(0)
+            return digest.hexdigest(), discord.File(fp, filename=attachment.filename)
+
+    async with aiohttp.ClientSession() as session:
+        tasks = [asyncio.create_task(fetch(session, a)) for a in attachments]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for task in tasks:
+                if not task.cancelled() and task.exception() is None:
+                    task.result()[1].close()
+            raise
+    return [task.result() for task in tasks]